@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import GameRoom, ChatMessage, PlayerStats, ChessGame
+from .models import GameRoom, ChatMessage, PlayerStats, ChessGame, ChessMove
 
 @admin.register(GameRoom)
 class GameRoomAdmin(admin.ModelAdmin):
@@ -18,3 +18,7 @@ class PlayerStatsAdmin(admin.ModelAdmin):
 class ChessGameAdmin(admin.ModelAdmin):
     list_display = ['code', 'white_player', 'black_player', 'is_bot_game', 'status', 'created_at']
     list_filter = ['status', 'is_bot_game']
+
+@admin.register(ChessMove)
+class ChessMoveAdmin(admin.ModelAdmin):
+    list_display = ['game', 'piece', 'from_pos', 'to_pos', 'is_bot', 'created_at']
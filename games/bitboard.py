@@ -0,0 +1,491 @@
+"""
+Bitboard board representation and move generation shared by the bot and
+the rules engine
+
+A position is one 64-bit int per piece code with bit (rank * 8 + file) set
+for every square that piece occupies, plus a 64-entry mailbox for "what is
+on this square" lookups. Leaper attacks come from per-square tables and
+slider attacks from magic bitboard tables, all built once at import.
+"""
+import random
+
+
+EMPTY = 0
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = 1, 2, 3, 4, 5, 6
+BLACK_OFFSET = 6
+
+# Mailbox code -> colour (0 white, 1 black) and piece type, indexed by code
+PIECE_COLOR = bytes((0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1))
+PIECE_TYPE = bytes((0, 1, 2, 3, 4, 5, 6, 1, 2, 3, 4, 5, 6))
+
+PIECE_CODES = {
+    'wp': 1, 'wn': 2, 'wb': 3, 'wr': 4, 'wq': 5, 'wk': 6,
+    'bp': 7, 'bn': 8, 'bb': 9, 'br': 10, 'bq': 11, 'bk': 12,
+}
+
+MASK64 = (1 << 64) - 1
+RANK_2 = 0xFF << 8
+RANK_7 = 0xFF << 48
+
+KNIGHT_STEPS = ((2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2))
+KING_STEPS = ((1, 1), (1, 0), (1, -1), (0, 1), (0, -1), (-1, 1), (-1, 0), (-1, -1))
+PAWN_CAPTURE_STEPS = (((1, 1), (1, -1)), ((-1, 1), (-1, -1)))
+ROOK_DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+BISHOP_DIRECTIONS = ((1, 1), (1, -1), (-1, 1), (-1, -1))
+
+# Magic multipliers for the slider attack tables (found offline by random search)
+ROOK_MAGICS = (
+    0x2080001440022581, 0x1080200040001080, 0x4080100008200080, 0x0280080080100254,
+    0x4D8004000A180080, 0x0100080400020100, 0x1080010040800200, 0x02000400A0814502,
+    0x0800800080400021, 0x0084402000401000, 0x0102004012002080, 0x3008801000800800,
+    0x2006001060440A00, 0x1000800200800400, 0x0004000441024810, 0xA001000082004100,
+    0x0040808000204014, 0x0000424002201000, 0x0010110041002000, 0x0000090021041000,
+    0x0204008004800800, 0x0000808004000200, 0x6006040021485042, 0x0000020002409924,
+    0x2000401980028020, 0x4000400100308100, 0x0000820200201041, 0xB100100080800800,
+    0x3004080080040080, 0x0802000200041009, 0x01A0580400021110, 0x00020042000408A1,
+    0x4218884000800023, 0x0480201000400045, 0x0010200080801000, 0x1200200901001000,
+    0x0000100801000500, 0x0080020080800400, 0x004A000100404080, 0x0480005402001081,
+    0x258000402000C000, 0xA010004820084002, 0x0480200010008080, 0x244100100021000C,
+    0x2040080005010010, 0x0012000810020004, 0x0011000200B9000C, 0x1121000080410002,
+    0x00082080410A0600, 0x4002008100402600, 0x0A0300E008544100, 0x7B00080010008080,
+    0x0300080100100500, 0x0002020080040080, 0x0042521810214400, 0x8A00004089140200,
+    0x00001280010A2041, 0x0400401102042086, 0x41902000100C4101, 0x0043020420900009,
+    0x00E2000410082002, 0x4402000108041002, 0x2100101A00814804, 0x0400010400218246,
+)
+
+BISHOP_MAGICS = (
+    0x2240081A22902100, 0x8020055224950082, 0x20100C04A7220384, 0x004820A020000400,
+    0x0E14052000008006, 0x0005140240000002, 0x00A0420805400800, 0x0202021042021000,
+    0xA0580488B0142080, 0x8102024404043040, 0x8180086204002004, 0x4220181481040202,
+    0x8000420210000000, 0x80002088A0080404, 0x0000084808241200, 0x040004422A100200,
+    0x0044041010104140, 0x1021280222040100, 0x00480040820010A2, 0x0088000082004011,
+    0x8084000200944000, 0x0441A00A00842050, 0x0401100C00821028, 0x0040210304022E40,
+    0x0004200110321042, 0x104A300408010818, 0x0000280810004044, 0x0008080000820002,
+    0x0115004094044001, 0x2941090012100091, 0x0841084202021004, 0x00020048008400BA,
+    0x100802B0000A2024, 0x000402680C200100, 0x4000109005280840, 0x0001020080880080,
+    0x0448020400001100, 0x0004180020021000, 0x0010016100004400, 0x0040911200004A10,
+    0x1802011040000808, 0x4021080230C90210, 0x0944101088001000, 0xC000082018000108,
+    0x800420220C000081, 0x0804408801100200, 0x4802080A0C110080, 0x2201440102000040,
+    0x1041080110488404, 0x1010248608210001, 0x030012020F044148, 0x0000001F04090082,
+    0x0000000410440400, 0x20000490224A0000, 0x021020010402B844, 0x8004012401020000,
+    0x1000288200A02004, 0x0010A444041C1302, 0x000000004210900C, 0x1106202240208820,
+    0x0080200110020880, 0x0008080820080082, 0x0800A00801082881, 0x8020940408182820,
+)
+
+
+def _step_attacks(sq, steps):
+    """Bitboard of squares reachable from sq by one of the (rank, file) steps"""
+    rank, file = divmod(sq, 8)
+    attacks = 0
+    for dr, df in steps:
+        r, f = rank + dr, file + df
+        if 0 <= r < 8 and 0 <= f < 8:
+            attacks |= 1 << (r * 8 + f)
+    return attacks
+
+
+def _ray_attacks(sq, occupied, directions):
+    """Slider attacks by walking each ray until it hits an occupied square"""
+    rank, file = divmod(sq, 8)
+    attacks = 0
+    for dr, df in directions:
+        r, f = rank + dr, file + df
+        while 0 <= r < 8 and 0 <= f < 8:
+            bit = 1 << (r * 8 + f)
+            attacks |= bit
+            if occupied & bit:
+                break
+            r, f = r + dr, f + df
+    return attacks
+
+
+def _relevant_mask(sq, directions):
+    """Squares whose occupancy can block a slider on sq (board edges excluded)"""
+    rank, file = divmod(sq, 8)
+    mask = 0
+    for dr, df in directions:
+        r, f = rank + dr, file + df
+        while 0 <= r + dr < 8 and 0 <= f + df < 8:
+            mask |= 1 << (r * 8 + f)
+            r, f = r + dr, f + df
+    return mask
+
+
+def _build_magic_tables(directions, magics):
+    """Fill the per-square attack tables indexed by ((occ & mask) * magic) >> shift"""
+    masks, shifts, tables = [], [], []
+    for sq in range(64):
+        mask = _relevant_mask(sq, directions)
+        shift = 64 - bin(mask).count('1')
+        table = [0] * (1 << (64 - shift))
+        magic = magics[sq]
+        # Enumerate every subset of the mask (Carry-Rippler)
+        subset = 0
+        while True:
+            table[((subset * magic) & MASK64) >> shift] = _ray_attacks(sq, subset, directions)
+            subset = (subset - mask) & mask
+            if not subset:
+                break
+        masks.append(mask)
+        shifts.append(shift)
+        tables.append(table)
+    return tuple(masks), tuple(shifts), tuple(tables)
+
+
+KNIGHT_ATTACKS = tuple(_step_attacks(sq, KNIGHT_STEPS) for sq in range(64))
+KING_ATTACKS = tuple(_step_attacks(sq, KING_STEPS) for sq in range(64))
+# PAWN_ATTACKS[side][sq]: squares a pawn of side standing on sq attacks
+PAWN_ATTACKS = tuple(
+    tuple(_step_attacks(sq, steps) for sq in range(64)) for steps in PAWN_CAPTURE_STEPS
+)
+ROOK_MASKS, ROOK_SHIFTS, ROOK_TABLES = _build_magic_tables(ROOK_DIRECTIONS, ROOK_MAGICS)
+BISHOP_MASKS, BISHOP_SHIFTS, BISHOP_TABLES = _build_magic_tables(BISHOP_DIRECTIONS, BISHOP_MAGICS)
+
+
+# Zobrist keys per piece code and square, fixed seed so hashes are reproducible
+_zobrist_rng = random.Random(0x5EED)
+ZOBRIST = tuple(tuple(_zobrist_rng.getrandbits(64) for _ in range(64)) for _ in range(13))
+ZOBRIST_SIDE = _zobrist_rng.getrandbits(64)
+
+
+def rook_attacks(sq, occupied):
+    """Rook attack bitboard from sq given the full board occupancy"""
+    index = (((occupied & ROOK_MASKS[sq]) * ROOK_MAGICS[sq]) & MASK64) >> ROOK_SHIFTS[sq]
+    return ROOK_TABLES[sq][index]
+
+
+def bishop_attacks(sq, occupied):
+    """Bishop attack bitboard from sq given the full board occupancy"""
+    index = (((occupied & BISHOP_MASKS[sq]) * BISHOP_MAGICS[sq]) & MASK64) >> BISHOP_SHIFTS[sq]
+    return BISHOP_TABLES[sq][index]
+
+
+# Empty-board slider lines through every square
+ROOK_RAYS = tuple(rook_attacks(sq, 0) for sq in range(64))
+BISHOP_RAYS = tuple(bishop_attacks(sq, 0) for sq in range(64))
+
+
+def _between(a, b):
+    """Squares strictly between a and b if they share a line, else 0"""
+    if ROOK_RAYS[a] >> b & 1:
+        return rook_attacks(a, 1 << b) & rook_attacks(b, 1 << a)
+    if BISHOP_RAYS[a] >> b & 1:
+        return bishop_attacks(a, 1 << b) & bishop_attacks(b, 1 << a)
+    return 0
+
+
+# BETWEEN[a][b]: squares a slider must cross to get from a to b
+BETWEEN = tuple(tuple(_between(a, b) for b in range(64)) for a in range(64))
+
+# Algebraic name of every 0-63 square and its inverse
+SQ_NAMES = tuple(f"{file}{rank}" for rank in range(1, 9) for file in "abcdefgh")
+SQ_INDEX = {name: sq for sq, name in enumerate(SQ_NAMES)}
+
+
+def lsb(bb):
+    """Index of the lowest set bit of a non-empty bitboard"""
+    return (bb & -bb).bit_length() - 1
+
+
+def iter_bits(bb):
+    """Yield the index of every set bit, lowest first"""
+    while bb:
+        yield (bb & -bb).bit_length() - 1
+        bb &= bb - 1
+
+
+def pack_board(board_state):
+    """
+    32-byte board for the wire: byte i holds square 2i's piece code in its
+    low nibble and square 2i+1's in its high nibble (0 = empty)
+    """
+    packed = bytearray(32)
+    for pos, piece in board_state.items():
+        sq = SQ_INDEX[pos]
+        packed[sq >> 1] |= PIECE_CODES[piece] << ((sq & 1) << 2)
+    return bytes(packed)
+
+
+def side_of(color):
+    """Normalize 'white'/'w'/'black'/'b' to 0 (white) or 1 (black)"""
+    return 1 if color[0] == 'b' else 0
+
+
+class Position:
+    """
+    Bitboard position
+    bb[piece_code] holds that piece's squares, occ[side] each side's pieces,
+    mailbox[sq] the piece code on every square, kings[side] each king's
+    square (-1 if missing) and hash the Zobrist key, all of which
+    make/unmake keep up to date (including the side to move)
+    """
+
+    __slots__ = ('bb', 'occ', 'mailbox', 'hash', 'kings')
+
+    def __init__(self, bb, occ, mailbox, hash=0):
+        self.bb = bb
+        self.occ = occ
+        self.mailbox = mailbox
+        self.hash = hash
+        self.kings = [bb[KING].bit_length() - 1, bb[KING + BLACK_OFFSET].bit_length() - 1]
+
+    @classmethod
+    def from_dict(cls, board_state):
+        bb = [0] * 13
+        occ = [0, 0]
+        mailbox = bytearray(64)
+        hash = 0
+        for pos, piece in board_state.items():
+            if piece:
+                sq = SQ_INDEX[pos]
+                code = PIECE_CODES[piece]
+                bit = 1 << sq
+                bb[code] |= bit
+                occ[PIECE_COLOR[code]] |= bit
+                mailbox[sq] = code
+                hash ^= ZOBRIST[code][sq]
+        return cls(bb, occ, mailbox, hash)
+
+    def make(self, from_sq, to_sq):
+        """
+        Apply a move in place, removing any captured piece
+        Pawns reaching the last rank become queens
+        Returns (piece, captured) for unmake
+        Kings are never captured: the search refutes such a move first
+        """
+        mailbox = self.mailbox
+        piece = mailbox[from_sq]
+        captured = mailbox[to_sq]
+        from_bit = 1 << from_sq
+        to_bit = 1 << to_sq
+        side = PIECE_COLOR[piece]
+
+        if captured:
+            self.bb[captured] ^= to_bit
+            self.occ[side ^ 1] ^= to_bit
+            self.hash ^= ZOBRIST[captured][to_sq]
+
+        placed = piece
+        if PIECE_TYPE[piece] == PAWN and to_sq >> 3 in (0, 7):
+            placed = piece + (QUEEN - PAWN)
+
+        self.bb[piece] ^= from_bit
+        self.bb[placed] ^= to_bit
+        self.occ[side] ^= from_bit | to_bit
+        self.hash ^= ZOBRIST[piece][from_sq] ^ ZOBRIST[placed][to_sq] ^ ZOBRIST_SIDE
+        mailbox[to_sq] = placed
+        mailbox[from_sq] = EMPTY
+        if placed == KING + side * BLACK_OFFSET:
+            self.kings[side] = to_sq
+        return piece, captured
+
+    def unmake(self, from_sq, to_sq, piece, captured):
+        """Take back a move applied by make"""
+        mailbox = self.mailbox
+        placed = mailbox[to_sq]
+        from_bit = 1 << from_sq
+        to_bit = 1 << to_sq
+        side = PIECE_COLOR[piece]
+
+        self.bb[placed] ^= to_bit
+        self.bb[piece] ^= from_bit
+        self.occ[side] ^= from_bit | to_bit
+        self.hash ^= ZOBRIST[piece][from_sq] ^ ZOBRIST[placed][to_sq] ^ ZOBRIST_SIDE
+        mailbox[from_sq] = piece
+        mailbox[to_sq] = captured
+        if piece == KING + side * BLACK_OFFSET:
+            self.kings[side] = from_sq
+
+        if captured:
+            self.bb[captured] ^= to_bit
+            self.occ[side ^ 1] ^= to_bit
+            self.hash ^= ZOBRIST[captured][to_sq]
+
+
+def is_square_attacked(position, sq, by_side):
+    """Check if square is attacked by any piece of given side"""
+    bb = position.bb
+    base = by_side * BLACK_OFFSET
+
+    # Single-table tests first: knights, pawns, then the king.
+    # A by_side pawn hits sq from the squares an opposing pawn on sq would attack
+    if KNIGHT_ATTACKS[sq] & bb[KNIGHT + base]:
+        return True
+    if PAWN_ATTACKS[1 - by_side][sq] & bb[PAWN + base]:
+        return True
+    if KING_ATTACKS[sq] & bb[KING + base]:
+        return True
+
+    # Sliders only need the magic lookup if one stands on a line through sq
+    queens = bb[QUEEN + base]
+    diagonal = BISHOP_RAYS[sq] & (bb[BISHOP + base] | queens)
+    straight = ROOK_RAYS[sq] & (bb[ROOK + base] | queens)
+    if not (diagonal or straight):
+        return False
+
+    occupied = position.occ[0] | position.occ[1]
+    if diagonal and bishop_attacks(sq, occupied) & diagonal:
+        return True
+    if straight and rook_attacks(sq, occupied) & straight:
+        return True
+
+    return False
+
+
+def piece_pseudo_moves(sq, piece, position):
+    """
+    Pseudo-legal target squares for the piece on sq as a bitboard
+    (doesn't check king safety)
+    """
+    side = PIECE_COLOR[piece]
+    piece_type = PIECE_TYPE[piece]
+    own = position.occ[side]
+
+    if piece_type == PAWN:
+        return pawn_moves(sq, side, position)
+    if piece_type == KNIGHT:
+        return KNIGHT_ATTACKS[sq] & ~own
+    if piece_type == KING:
+        return king_moves(sq, side, position)
+
+    occupied = position.occ[0] | position.occ[1]
+    if piece_type == BISHOP:
+        return bishop_attacks(sq, occupied) & ~own
+    if piece_type == ROOK:
+        return rook_attacks(sq, occupied) & ~own
+    if piece_type == QUEEN:
+        return (rook_attacks(sq, occupied) | bishop_attacks(sq, occupied)) & ~own
+    return 0
+
+
+def pawn_moves(sq, side, position):
+    """Pawn pushes and captures as a bitboard"""
+    bit = 1 << sq
+    empty = MASK64 ^ (position.occ[0] | position.occ[1])
+
+    if side == 0:
+        single = (bit << 8) & empty
+        double = ((single & (RANK_2 << 8)) << 8) & empty
+    else:
+        single = (bit >> 8) & empty
+        double = ((single & (RANK_7 >> 8)) >> 8) & empty
+
+    return single | double | (PAWN_ATTACKS[side][sq] & position.occ[1 - side])
+
+
+def king_moves(sq, side, position):
+    """King moves (one square any direction) as a bitboard"""
+    targets = KING_ATTACKS[sq] & ~position.occ[side]
+
+    # Never step next to the enemy king
+    enemy_king = position.kings[1 - side]
+    if enemy_king >= 0:
+        targets &= ~KING_ATTACKS[enemy_king]
+    return targets
+
+
+def is_move_safe_for_king(position, from_sq, to_sq, side):
+    """
+    Check that a move doesn't leave side's king in check
+    Makes the move in place, tests the king square, then takes it back
+    """
+    piece, captured = position.make(from_sq, to_sq)
+    safe = not is_square_attacked(position, position.kings[side], 1 - side)
+    position.unmake(from_sq, to_sq, piece, captured)
+    return safe
+
+
+def compute_checkers_and_pins(position, side):
+    """
+    Find what attacks side's king
+    Returns (checkers, pins): a bitboard of the enemy pieces giving check
+    and {pinned_sq: ray} for own pieces that may only move along ray
+    (the squares up to and including the pinning piece)
+    """
+    bb = position.bb
+    king_sq = position.kings[side]
+    enemy = (1 - side) * BLACK_OFFSET
+    occupied = position.occ[0] | position.occ[1]
+    own = position.occ[side]
+
+    checkers = (
+        (PAWN_ATTACKS[side][king_sq] & bb[PAWN + enemy])
+        | (KNIGHT_ATTACKS[king_sq] & bb[KNIGHT + enemy])
+        | (KING_ATTACKS[king_sq] & bb[KING + enemy])
+    )
+    pins = {}
+
+    # Enemy sliders lined up with the king, ignoring everything in between
+    queens = bb[QUEEN + enemy]
+    snipers = (
+        (ROOK_RAYS[king_sq] & (bb[ROOK + enemy] | queens))
+        | (BISHOP_RAYS[king_sq] & (bb[BISHOP + enemy] | queens))
+    )
+    for sniper_sq in iter_bits(snipers):
+        between = BETWEEN[king_sq][sniper_sq]
+        blockers = between & occupied
+        if not blockers:
+            checkers |= 1 << sniper_sq
+        elif blockers.bit_count() == 1 and blockers & own:
+            # A lone own piece in the way is pinned
+            pins[lsb(blockers)] = between | 1 << sniper_sq
+
+    return checkers, pins
+
+
+def is_legal(position, from_sq, to_sq, side, checkers, pins):
+    """
+    King-safety test for a pseudo-legal move, given the checkers and pins
+    from compute_checkers_and_pins
+    """
+    king_sq = position.kings[side]
+    if from_sq == king_sq:
+        # King moves need the destination attack test
+        return is_move_safe_for_king(position, from_sq, to_sq, side)
+
+    # A pinned piece may only slide along its pin
+    ray = pins.get(from_sq)
+    if ray is not None and not ray >> to_sq & 1:
+        return False
+
+    if checkers:
+        # Double check: only the king can move
+        if checkers.bit_count() > 1:
+            return False
+        # Single check: capture the checker or block its line
+        return bool((checkers | BETWEEN[king_sq][lsb(checkers)]) >> to_sq & 1)
+
+    return True
+
+
+def iter_legal_moves(position, side, checkers, pins):
+    """
+    Yield legal (from_sq, to_sq) moves lazily, given the checkers and pins
+    from compute_checkers_and_pins
+    """
+    king_sq = position.kings[side]
+
+    # In double check only the king can move, so skip everything else
+    if checkers.bit_count() > 1:
+        for to_sq in iter_bits(king_moves(king_sq, side, position)):
+            if is_move_safe_for_king(position, king_sq, to_sq, side):
+                yield king_sq, to_sq
+        return
+
+    # Only squares each piece can actually reach are tried, and each
+    # one is checked against the checkers and pins
+    base = side * BLACK_OFFSET
+    for piece in range(PAWN + base, KING + base + 1):
+        for from_sq in iter_bits(position.bb[piece]):
+            for to_sq in iter_bits(piece_pseudo_moves(from_sq, piece, position)):
+                if is_legal(position, from_sq, to_sq, side, checkers, pins):
+                    yield from_sq, to_sq
+
+
+def generate_legal_moves(position, side):
+    """All legal (from_sq, to_sq) moves for side"""
+    if position.kings[side] < 0:
+        return []
+
+    checkers, pins = compute_checkers_and_pins(position, side)
+    return list(iter_legal_moves(position, side, checkers, pins))
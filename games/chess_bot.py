@@ -1,420 +1,286 @@
 """
 Chess Bot Engine with Mandatory Rule Enforcement
-Priority-based decision making with full legal move validation
+Alpha-beta search over fully validated root moves
+
+Positions are the bitboards from games.bitboard, searched in place with
+make/unmake.
 """
 import random
 
+from .bitboard import (
+    BLACK_OFFSET, KING, PAWN, PIECE_TYPE, SQ_NAMES, ZOBRIST_SIDE, Position,
+    generate_legal_moves, is_square_attacked, piece_pseudo_moves, side_of,
+)
+
+
+SEARCH_DEPTH = 3
+MATE_SCORE = 100000
+# Score for a side that can take the enemy king: the previous move was illegal
+KING_CAPTURE = 2 * MATE_SCORE
+INFINITY = 4 * MATE_SCORE
+
+# Transposition table entry flags: exact score, lower bound, upper bound
+TT_EXACT, TT_LOWER, TT_UPPER = 0, 1, 2
+
+# Material values indexed by piece type
+PIECE_VALUES = (0, 100, 320, 330, 500, 900, 20000)
+
+# Piece-square tables from white's point of view, rank 8 first
+PAWN_TABLE = (
+     0,   0,   0,   0,   0,   0,   0,   0,
+    50,  50,  50,  50,  50,  50,  50,  50,
+    10,  10,  20,  30,  30,  20,  10,  10,
+     5,   5,  10,  25,  25,  10,   5,   5,
+     0,   0,   0,  20,  20,   0,   0,   0,
+     5,  -5, -10,   0,   0, -10,  -5,   5,
+     5,  10,  10, -20, -20,  10,  10,   5,
+     0,   0,   0,   0,   0,   0,   0,   0,
+)
+KNIGHT_TABLE = (
+   -50, -40, -30, -30, -30, -30, -40, -50,
+   -40, -20,   0,   0,   0,   0, -20, -40,
+   -30,   0,  10,  15,  15,  10,   0, -30,
+   -30,   5,  15,  20,  20,  15,   5, -30,
+   -30,   0,  15,  20,  20,  15,   0, -30,
+   -30,   5,  10,  15,  15,  10,   5, -30,
+   -40, -20,   0,   5,   5,   0, -20, -40,
+   -50, -40, -30, -30, -30, -30, -40, -50,
+)
+BISHOP_TABLE = (
+   -20, -10, -10, -10, -10, -10, -10, -20,
+   -10,   0,   0,   0,   0,   0,   0, -10,
+   -10,   0,   5,  10,  10,   5,   0, -10,
+   -10,   5,   5,  10,  10,   5,   5, -10,
+   -10,   0,  10,  10,  10,  10,   0, -10,
+   -10,  10,  10,  10,  10,  10,  10, -10,
+   -10,   5,   0,   0,   0,   0,   5, -10,
+   -20, -10, -10, -10, -10, -10, -10, -20,
+)
+ROOK_TABLE = (
+     0,   0,   0,   0,   0,   0,   0,   0,
+     5,  10,  10,  10,  10,  10,  10,   5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+     0,   0,   0,   5,   5,   0,   0,   0,
+)
+QUEEN_TABLE = (
+   -20, -10, -10,  -5,  -5, -10, -10, -20,
+   -10,   0,   0,   0,   0,   0,   0, -10,
+   -10,   0,   5,   5,   5,   5,   0, -10,
+    -5,   0,   5,   5,   5,   5,   0,  -5,
+     0,   0,   5,   5,   5,   5,   0,  -5,
+   -10,   5,   5,   5,   5,   5,   0, -10,
+   -10,   0,   5,   0,   0,   0,   0, -10,
+   -20, -10, -10,  -5,  -5, -10, -10, -20,
+)
+KING_TABLE = (
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -20, -30, -30, -40, -40, -30, -30, -20,
+   -10, -20, -20, -20, -20, -20, -20, -10,
+    20,  20,   0,   0,   0,   0,  20,  20,
+    20,  30,  10,   0,   0,  10,  30,  20,
+)
+
+def _square_scores():
+    """Material + placement score of every piece code on every square, white positive"""
+    tables = (None, PAWN_TABLE, KNIGHT_TABLE, BISHOP_TABLE, ROOK_TABLE, QUEEN_TABLE, KING_TABLE)
+    scores = [(0,) * 64]
+    for piece_type in range(PAWN, KING + 1):
+        # The tables list rank 8 first, so a white piece on sq reads entry sq ^ 56
+        scores.append(tuple(PIECE_VALUES[piece_type] + tables[piece_type][sq ^ 56] for sq in range(64)))
+    for piece_type in range(PAWN, KING + 1):
+        scores.append(tuple(-(PIECE_VALUES[piece_type] + tables[piece_type][sq]) for sq in range(64)))
+    return tuple(scores)
+
+
+SQUARE_SCORES = _square_scores()
 
 class ChessBot:
     """
     Chess bot with mandatory rule enforcement
-    
-    Priority Order:
-    1. Resolve check (capture attacker, block, or move king)
-    2. Detect checkmate/stalemate and end game
-    3. Prefer safe moves that don't expose king
-    4. Make strategic moves (captures, center control)
+
+    Every root move is validated for king safety, then scored with a
+    depth-limited negamax alpha-beta search. Checkmate and stalemate fall
+    out of the search: a side whose every move loses its king is mated
+    if in check and stalemated otherwise.
     """
-    
+
     @staticmethod
     def make_move(board_state, color):
         """
-        Main entry point - generates a legal move with priority enforcement
+        Main entry point - searches for the best legal move
         Returns: (from_pos, to_pos) tuple or None if no legal moves
         """
-        from .chess_rules import ChessRules
-        
-        # Step 1: Calculate ALL legal moves (filtered for king safety)
-        legal_moves = ChessBot.get_all_legal_moves(board_state, color)
-        
+        position = Position.from_dict(board_state)
+        side = side_of(color)
+
+        # Step 1: Calculate ALL legal moves, with the generator the rules
+        # engine uses so the bot and the move validation can't disagree
+        legal_moves = generate_legal_moves(position, side)
+
         # Step 2: If no legal moves, return None (checkmate or stalemate)
         if not legal_moves:
             return None
-        
-        # Step 3: Check if currently in check
-        in_check = ChessRules.is_in_check(board_state, color)
-        
-        if in_check:
-            # PRIORITY 1: Must resolve check immediately
-            return ChessBot.select_check_escape_move(board_state, legal_moves, color)
-        
-        # PRIORITY 3 & 4: Select safe strategic move
-        return ChessBot.select_strategic_move(board_state, legal_moves, color)
-    
-    @staticmethod
-    def get_all_legal_moves(board_state, color):
-        """
-        Generate complete list of legal moves
-        Every move is validated to ensure king is not left in check
-        """
-        legal_moves = []
-        color_code = color[0] if len(color) > 1 else color
-        
-        for pos, piece in board_state.items():
-            if piece and piece[0] == color_code:
-                # Get pseudo-legal moves for this piece
-                piece_moves = ChessBot.get_piece_pseudo_moves(pos, piece, board_state)
-                
-                # Filter: only keep moves that don't leave king in check
-                for target in piece_moves:
-                    if ChessBot.is_move_safe_for_king(board_state, pos, target, color):
-                        legal_moves.append((pos, target))
-        
-        return legal_moves
-    
-    @staticmethod
-    def is_move_safe_for_king(board_state, from_pos, to_pos, color):
-        """
-        Validate that a move doesn't leave the king in check
-        Simulates the move and checks king safety
-        """
-        # Simulate move
-        test_board = dict(board_state)
-        piece = test_board[from_pos]
-        test_board[to_pos] = piece
-        del test_board[from_pos]
-        
-        # Find king position
-        color_code = color[0] if len(color) > 1 else color
-        king_piece = f"{color_code}k"
-        king_pos = None
-        
-        for pos, p in test_board.items():
-            if p == king_piece:
-                king_pos = pos
-                break
-        
-        if not king_pos:
-            return False
-        
-        # Check if king is under attack
-        opponent = 'white' if color in ['black', 'b'] else 'black'
-        return not ChessBot.is_square_under_attack(test_board, king_pos, opponent)
-    
+
+        # Step 3: Search every legal move and keep the best one, deepening
+        # one ply at a time so each pass is ordered by the previous one
+        if side:
+            position.hash ^= ZOBRIST_SIDE
+        tt = {}
+        best_move = legal_moves[0]
+        for depth in range(1, SEARCH_DEPTH + 1):
+            best_move = ChessBot.search_root(position, legal_moves, side, depth, tt, best_move)
+
+        from_sq, to_sq = best_move
+        return SQ_NAMES[from_sq], SQ_NAMES[to_sq]
+
     @staticmethod
-    def select_check_escape_move(board_state, legal_moves, color):
+    def search_root(position, legal_moves, side, depth, tt, first_move=None):
         """
-        Select best move to escape check
-        Priority: Capture attacker > Block > Move king
+        Negamax over the validated root moves, best-scoring move wins
+        Ties are broken at random so the bot doesn't replay the same game
         """
-        capture_moves = []
-        block_moves = []
-        king_moves = []
-        
-        color_code = color[0] if len(color) > 1 else color
-        
-        for from_pos, to_pos in legal_moves:
-            piece = board_state[from_pos]
-            
-            # Categorize moves
-            if piece[1] == 'k':
-                # King move
-                king_moves.append((from_pos, to_pos))
-            elif to_pos in board_state:
-                # Capture (might capture the attacker)
-                capture_moves.append((from_pos, to_pos))
-            else:
-                # Block move
-                block_moves.append((from_pos, to_pos))
-        
-        # Priority: Capture > Block > King move
-        if capture_moves:
-            return random.choice(capture_moves)
-        if block_moves:
-            return random.choice(block_moves)
-        if king_moves:
-            return random.choice(king_moves)
-        
-        # Fallback: any legal move
-        return random.choice(legal_moves)
-    
+        alpha = -INFINITY
+        best_moves = [legal_moves[0]]
+
+        for move in ChessBot.order_moves(position, legal_moves, first_move):
+            from_sq, to_sq = move
+            piece, captured = position.make(from_sq, to_sq)
+            # Window opens one below the best score so equal moves come back exact
+            score = -ChessBot.negamax(position, depth - 1, -INFINITY, 1 - alpha, 1 - side, tt)
+            position.unmake(from_sq, to_sq, piece, captured)
+
+            if score > alpha:
+                alpha = score
+                best_moves = [move]
+            elif score == alpha:
+                best_moves.append(move)
+
+        return random.choice(best_moves)
+
     @staticmethod
-    def select_strategic_move(board_state, legal_moves, color):
+    def negamax(position, depth, alpha, beta, side, tt):
         """
-        Select strategic move when not in check
-        Prioritizes safe moves that don't expose king
+        Alpha-beta search below the root, scored for side to move
+        Moves here are pseudo-legal: an illegal move is refuted by the
+        opponent capturing the king on the next ply
+        Results are cached in tt as position hash -> (depth, score, flag, move)
         """
-        # Categorize moves by safety and value
-        safe_captures = []
-        safe_moves = []
-        risky_captures = []
-        risky_moves = []
-        
-        for from_pos, to_pos in legal_moves:
-            is_capture = to_pos in board_state
-            is_safe = ChessBot.is_move_safe_position(board_state, from_pos, to_pos, color)
-            
-            if is_capture:
-                if is_safe:
-                    safe_captures.append((from_pos, to_pos))
+        key = position.hash
+        tt_move = None
+        entry = tt.get(key)
+        if entry is not None:
+            tt_depth, tt_score, tt_flag, tt_move = entry
+            if tt_depth >= depth:
+                if tt_flag == TT_EXACT:
+                    return tt_score
+                if tt_flag == TT_LOWER:
+                    alpha = max(alpha, tt_score)
                 else:
-                    risky_captures.append((from_pos, to_pos))
+                    beta = min(beta, tt_score)
+                if alpha >= beta:
+                    return tt_score
+
+        moves = ChessBot.get_pseudo_moves(position, side)
+        if moves is None:
+            return KING_CAPTURE
+        if depth == 0:
+            return ChessBot.evaluate(position, side)
+
+        alpha_start = alpha
+        best = -INFINITY
+        best_move = None
+        for from_sq, to_sq in ChessBot.order_moves(position, moves, tt_move):
+            piece, captured = position.make(from_sq, to_sq)
+            score = -ChessBot.negamax(position, depth - 1, -beta, -alpha, 1 - side, tt)
+            position.unmake(from_sq, to_sq, piece, captured)
+
+            if score > best:
+                best = score
+                best_move = (from_sq, to_sq)
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+
+        if best == -KING_CAPTURE:
+            # Every move loses the king: checkmate if in check, else stalemate
+            if is_square_attacked(position, position.kings[side], 1 - side):
+                # Prefer mates found closer to the root
+                best = -MATE_SCORE - depth
             else:
-                if is_safe:
-                    safe_moves.append((from_pos, to_pos))
-                else:
-                    risky_moves.append((from_pos, to_pos))
-        
-        # Priority: Safe captures > Safe moves > Risky captures > Risky moves
-        if safe_captures:
-            return random.choice(safe_captures)
-        if safe_moves:
-            return random.choice(safe_moves)
-        if risky_captures:
-            return random.choice(risky_captures)
-        if risky_moves:
-            return random.choice(risky_moves)
-        
-        # Fallback
-        return random.choice(legal_moves)
-    
+                best = 0
+            flag = TT_EXACT
+        elif best <= alpha_start:
+            flag = TT_UPPER
+        elif best >= beta:
+            flag = TT_LOWER
+        else:
+            flag = TT_EXACT
+
+        tt[key] = (depth, best, flag, best_move)
+        return best
+
     @staticmethod
-    def is_move_safe_position(board_state, from_pos, to_pos, color):
+    def evaluate(position, side):
+        """Material + piece-square score from side's point of view"""
+        score = 0
+        for piece in range(PAWN, KING + BLACK_OFFSET + 1):
+            table = SQUARE_SCORES[piece]
+            pieces = position.bb[piece]
+            while pieces:
+                score += table[(pieces & -pieces).bit_length() - 1]
+                pieces &= pieces - 1
+        return -score if side else score
+
+    @staticmethod
+    def get_pseudo_moves(position, side):
         """
-        Check if the destination square is safe (not under attack after move)
+        Pseudo-legal (from_sq, to_sq) moves for side
+        Returns None if one of them captures the enemy king
         """
-        # Simulate move
-        test_board = dict(board_state)
-        piece = test_board[from_pos]
-        test_board[to_pos] = piece
-        del test_board[from_pos]
-        
-        # Check if destination is under attack
-        opponent = 'white' if color in ['black', 'b'] else 'black'
-        return not ChessBot.is_square_under_attack(test_board, to_pos, opponent)
-    
-    @staticmethod
-    def get_piece_pseudo_moves(pos, piece, board_state):
-        """Get pseudo-legal moves for a piece (doesn't check king safety)"""
-        moves = []
-        col, row = pos[0], int(pos[1])
-        piece_type = piece[1]
-        piece_color = piece[0]
-        
-        if piece_type == 'p':
-            moves = ChessBot.get_pawn_moves(pos, piece_color, board_state)
-        elif piece_type == 'n':
-            moves = ChessBot.get_knight_moves(pos, piece_color, board_state)
-        elif piece_type == 'b':
-            moves = ChessBot.get_bishop_moves(pos, piece_color, board_state)
-        elif piece_type == 'r':
-            moves = ChessBot.get_rook_moves(pos, piece_color, board_state)
-        elif piece_type == 'q':
-            moves = ChessBot.get_queen_moves(pos, piece_color, board_state)
-        elif piece_type == 'k':
-            moves = ChessBot.get_king_moves(pos, piece_color, board_state)
-        
-        return moves
-    
-    @staticmethod
-    def get_pawn_moves(pos, color, board_state):
-        """Get pawn moves"""
-        moves = []
-        col, row = pos[0], int(pos[1])
-        direction = 1 if color == 'w' else -1
-        start_row = 2 if color == 'w' else 7
-        
-        # Forward move
-        new_row = row + direction
-        if 1 <= new_row <= 8:
-            forward = f"{col}{new_row}"
-            if forward not in board_state:
-                moves.append(forward)
-                
-                # Double move from start
-                if row == start_row:
-                    double = f"{col}{row + 2 * direction}"
-                    middle = f"{col}{row + direction}"
-                    if double not in board_state and middle not in board_state:
-                        moves.append(double)
-        
-        # Diagonal captures
-        for dc in [-1, 1]:
-            new_col = chr(ord(col) + dc)
-            new_row = row + direction
-            if 'a' <= new_col <= 'h' and 1 <= new_row <= 8:
-                capture = f"{new_col}{new_row}"
-                if capture in board_state and board_state[capture][0] != color:
-                    moves.append(capture)
-        
-        return moves
-    
-    @staticmethod
-    def get_knight_moves(pos, color, board_state):
-        """Get knight moves"""
-        moves = []
-        col, row = pos[0], int(pos[1])
-        
-        knight_offsets = [
-            (2, 1), (2, -1), (-2, 1), (-2, -1),
-            (1, 2), (1, -2), (-1, 2), (-1, -2)
-        ]
-        
-        for dc, dr in knight_offsets:
-            new_col = chr(ord(col) + dc)
-            new_row = row + dr
-            if 'a' <= new_col <= 'h' and 1 <= new_row <= 8:
-                target = f"{new_col}{new_row}"
-                if target not in board_state or board_state[target][0] != color:
-                    moves.append(target)
-        
-        return moves
-    
-    @staticmethod
-    def get_bishop_moves(pos, color, board_state):
-        """Get bishop moves (diagonals)"""
-        moves = []
-        for direction in [(1, 1), (1, -1), (-1, 1), (-1, -1)]:
-            moves.extend(ChessBot.get_sliding_moves(pos, direction, color, board_state))
-        return moves
-    
-    @staticmethod
-    def get_rook_moves(pos, color, board_state):
-        """Get rook moves (straight lines)"""
-        moves = []
-        for direction in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-            moves.extend(ChessBot.get_sliding_moves(pos, direction, color, board_state))
-        return moves
-    
-    @staticmethod
-    def get_queen_moves(pos, color, board_state):
-        """Get queen moves (all directions)"""
         moves = []
-        for direction in [(0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)]:
-            moves.extend(ChessBot.get_sliding_moves(pos, direction, color, board_state))
-        return moves
-    
-    @staticmethod
-    def get_king_moves(pos, color, board_state):
-        """Get king moves (one square any direction)"""
-        moves = []
-        col, row = pos[0], int(pos[1])
-        
-        for dc in [-1, 0, 1]:
-            for dr in [-1, 0, 1]:
-                if dc == 0 and dr == 0:
-                    continue
-                new_col = chr(ord(col) + dc)
-                new_row = row + dr
-                if 'a' <= new_col <= 'h' and 1 <= new_row <= 8:
-                    target = f"{new_col}{new_row}"
-                    if target not in board_state or board_state[target][0] != color:
-                        # Check not adjacent to enemy king
-                        if not ChessBot.is_adjacent_to_enemy_king(board_state, target, color):
-                            moves.append(target)
-        
-        return moves
-    
-    @staticmethod
-    def get_sliding_moves(pos, direction, color, board_state):
-        """Get moves for sliding pieces (bishop, rook, queen)"""
-        moves = []
-        col, row = pos[0], int(pos[1])
-        dc, dr = direction
-        
-        for i in range(1, 8):
-            new_col = chr(ord(col) + dc * i)
-            new_row = row + dr * i
-            
-            if not ('a' <= new_col <= 'h' and 1 <= new_row <= 8):
-                break
-            
-            target = f"{new_col}{new_row}"
-            
-            if target in board_state:
-                if board_state[target][0] != color:
-                    moves.append(target)  # Capture
-                break  # Blocked
-            
-            moves.append(target)
-        
+        base = side * BLACK_OFFSET
+        enemy_king = position.bb[KING + (1 - side) * BLACK_OFFSET]
+
+        for piece in range(PAWN + base, KING + base + 1):
+            pieces = position.bb[piece]
+            while pieces:
+                from_sq = (pieces & -pieces).bit_length() - 1
+                pieces &= pieces - 1
+
+                targets = piece_pseudo_moves(from_sq, piece, position)
+                if targets & enemy_king:
+                    return None
+                while targets:
+                    to_sq = (targets & -targets).bit_length() - 1
+                    targets &= targets - 1
+                    moves.append((from_sq, to_sq))
+
         return moves
-    
-    @staticmethod
-    def is_adjacent_to_enemy_king(board_state, target, color):
-        """Check if target is adjacent to enemy king"""
-        col, row = target[0], int(target[1])
-        enemy_king = f"{'b' if color == 'w' else 'w'}k"
-        
-        for dc in [-1, 0, 1]:
-            for dr in [-1, 0, 1]:
-                if dc == 0 and dr == 0:
-                    continue
-                check_col = chr(ord(col) + dc)
-                check_row = row + dr
-                if 'a' <= check_col <= 'h' and 1 <= check_row <= 8:
-                    check_pos = f"{check_col}{check_row}"
-                    if check_pos in board_state and board_state[check_pos] == enemy_king:
-                        return True
-        return False
-    
-    @staticmethod
-    def is_square_under_attack(board_state, square, by_color):
-        """Check if square is attacked by any piece of given color"""
-        col, row = square[0], int(square[1])
-        by_code = by_color[0] if len(by_color) > 1 else by_color
-        
-        # Pawn attacks
-        pawn_dir = -1 if by_color in ['white', 'w'] else 1
-        for dc in [-1, 1]:
-            attack_col = chr(ord(col) + dc)
-            attack_row = row + pawn_dir
-            if 'a' <= attack_col <= 'h' and 1 <= attack_row <= 8:
-                pos = f"{attack_col}{attack_row}"
-                if pos in board_state and board_state[pos] == f"{by_code}p":
-                    return True
-        
-        # Knight attacks
-        for dc, dr in [(2,1), (2,-1), (-2,1), (-2,-1), (1,2), (1,-2), (-1,2), (-1,-2)]:
-            attack_col = chr(ord(col) + dc)
-            attack_row = row + dr
-            if 'a' <= attack_col <= 'h' and 1 <= attack_row <= 8:
-                pos = f"{attack_col}{attack_row}"
-                if pos in board_state and board_state[pos] == f"{by_code}n":
-                    return True
-        
-        # King attacks
-        for dc in [-1, 0, 1]:
-            for dr in [-1, 0, 1]:
-                if dc == 0 and dr == 0:
-                    continue
-                attack_col = chr(ord(col) + dc)
-                attack_row = row + dr
-                if 'a' <= attack_col <= 'h' and 1 <= attack_row <= 8:
-                    pos = f"{attack_col}{attack_row}"
-                    if pos in board_state and board_state[pos] == f"{by_code}k":
-                        return True
-        
-        # Sliding attacks (rook/queen - straight)
-        for direction in [(0,1), (0,-1), (1,0), (-1,0)]:
-            if ChessBot.check_sliding_attack(board_state, square, direction, by_code, ['r', 'q']):
-                return True
-        
-        # Sliding attacks (bishop/queen - diagonal)
-        for direction in [(1,1), (1,-1), (-1,1), (-1,-1)]:
-            if ChessBot.check_sliding_attack(board_state, square, direction, by_code, ['b', 'q']):
-                return True
-        
-        return False
-    
+
     @staticmethod
-    def check_sliding_attack(board_state, square, direction, by_code, piece_types):
-        """Check for sliding piece attack in a direction"""
-        col, row = square[0], int(square[1])
-        dc, dr = direction
-        
-        for i in range(1, 8):
-            new_col = chr(ord(col) + dc * i)
-            new_row = row + dr * i
-            
-            if not ('a' <= new_col <= 'h' and 1 <= new_row <= 8):
-                break
-            
-            pos = f"{new_col}{new_row}"
-            if pos in board_state:
-                piece = board_state[pos]
-                if piece[0] == by_code and piece[1] in piece_types:
-                    return True
-                break  # Blocked
-        
-        return False
+    def order_moves(position, moves, first_move=None):
+        """
+        Sort captures first by MVV-LVA (most valuable victim, then least
+        valuable attacker); quiet moves keep their generation order
+        first_move (the stored best move from an earlier search) goes first
+        """
+        mailbox = position.mailbox
+
+        def mvv_lva(move):
+            if move == first_move:
+                return 1000
+            victim = mailbox[move[1]]
+            if not victim:
+                return 0
+            # Piece types run P N B R Q K, so they already rank by value
+            return PIECE_TYPE[victim] * 8 - PIECE_TYPE[mailbox[move[0]]]
+
+        return sorted(moves, key=mvv_lva, reverse=True)
@@ -2,14 +2,21 @@
 Comprehensive Chess Rules Engine
 Validates all moves for both human and bot players
 """
+from .bitboard import (
+    BISHOP, BLACK_OFFSET, KING, KING_ATTACKS, KNIGHT, KNIGHT_ATTACKS, PAWN, PAWN_ATTACKS,
+    PIECE_COLOR, PIECE_TYPE, QUEEN, ROOK, SQ_INDEX, Position, bishop_attacks,
+    compute_checkers_and_pins, is_legal, is_square_attacked, iter_legal_moves, rook_attacks, side_of,
+)
+
 
 class ChessRules:
     """Complete chess rules validation engine"""
     
     @staticmethod
-    def is_valid_move(board_state, from_pos, to_pos, current_turn):
+    def is_valid_move(board_state, from_pos, to_pos, current_turn, position=None):
         """
         Main validation function - checks if a move is legal
+        position, if given, is board_state already parsed
         Returns (is_valid, error_message)
         """
         # Basic validation
@@ -27,6 +34,8 @@ class ChessRules:
             return False, "Not your piece"
         
         # Check if destination is valid
+        if to_pos not in SQ_INDEX:
+            return False, "Destination is off the board"
         if to_pos == from_pos:
             return False, "Must move to different square"
         
@@ -34,316 +43,157 @@ class ChessRules:
         if to_pos in board_state and board_state[to_pos][0] == piece[0]:
             return False, "Cannot capture your own piece"
         
+        # From here on work on the bitboard position and 0-63 squares
+        if position is None:
+            position = Position.from_dict(board_state)
+        from_sq, to_sq = SQ_INDEX[from_pos], SQ_INDEX[to_pos]
+        side = side_of(piece_color)
+        
         # Check if move is pseudo-legal for this piece type
-        if not ChessRules.is_pseudo_legal_move(board_state, from_pos, to_pos, piece):
+        if not ChessRules.is_pseudo_legal_move(position, from_sq, to_sq, position.mailbox[from_sq]):
             return False, "Illegal move for this piece"
         
         # Check if move leaves king in check (most important check)
-        if not ChessRules.is_move_legal_king_safety(board_state, from_pos, to_pos, piece_color):
+        if not ChessRules.is_move_legal_king_safety(position, from_sq, to_sq, side):
             return False, "Move leaves king in check"
         
         return True, "Valid move"
     
     @staticmethod
-    def is_pseudo_legal_move(board_state, from_pos, to_pos, piece):
+    def is_pseudo_legal_move(position, from_sq, to_sq, piece):
         """Check if move follows piece movement rules (doesn't check king safety yet)"""
-        piece_type = piece[1]
-        piece_color = piece[0]
-        
-        if piece_type == 'p':
-            return ChessRules.is_valid_pawn_move(board_state, from_pos, to_pos, piece_color)
-        elif piece_type == 'n':
-            return ChessRules.is_valid_knight_move(board_state, from_pos, to_pos, piece_color)
-        elif piece_type == 'b':
-            return ChessRules.is_valid_bishop_move(board_state, from_pos, to_pos, piece_color)
-        elif piece_type == 'r':
-            return ChessRules.is_valid_rook_move(board_state, from_pos, to_pos, piece_color)
-        elif piece_type == 'q':
-            return ChessRules.is_valid_queen_move(board_state, from_pos, to_pos, piece_color)
-        elif piece_type == 'k':
-            return ChessRules.is_valid_king_move(board_state, from_pos, to_pos, piece_color)
+        piece_type = PIECE_TYPE[piece]
+        side = PIECE_COLOR[piece]
+        
+        if piece_type == PAWN:
+            return ChessRules.is_valid_pawn_move(position, from_sq, to_sq, side)
+        elif piece_type == KNIGHT:
+            return ChessRules.is_valid_knight_move(position, from_sq, to_sq, side)
+        elif piece_type == BISHOP:
+            return ChessRules.is_valid_bishop_move(position, from_sq, to_sq, side)
+        elif piece_type == ROOK:
+            return ChessRules.is_valid_rook_move(position, from_sq, to_sq, side)
+        elif piece_type == QUEEN:
+            return ChessRules.is_valid_queen_move(position, from_sq, to_sq, side)
+        elif piece_type == KING:
+            return ChessRules.is_valid_king_move(position, from_sq, to_sq, side)
         
         return False
     
     @staticmethod
-    def is_valid_pawn_move(board_state, from_pos, to_pos, color):
+    def is_valid_pawn_move(position, from_sq, to_sq, side):
         """Validate pawn moves"""
-        from_col, from_row = from_pos[0], int(from_pos[1])
-        to_col, to_row = to_pos[0], int(to_pos[1])
-        
-        direction = 1 if color == 'w' else -1
-        start_row = 2 if color == 'w' else 7
+        occupied = position.occ[0] | position.occ[1]
+        step = -8 if side else 8
+        start_rank = 6 if side else 1
         
         # Forward move
-        if from_col == to_col:
-            # Single forward
-            if to_row == from_row + direction:
-                return to_pos not in board_state
-            # Double forward from start
-            if from_row == start_row and to_row == from_row + 2 * direction:
-                middle = f"{from_col}{from_row + direction}"
-                return to_pos not in board_state and middle not in board_state
-            return False
+        if to_sq == from_sq + step:
+            return not occupied >> to_sq & 1
+        # Double forward from start
+        if from_sq >> 3 == start_rank and to_sq == from_sq + 2 * step:
+            return not (occupied >> to_sq & 1 or occupied >> (from_sq + step) & 1)
         
         # Diagonal capture
-        if abs(ord(to_col) - ord(from_col)) == 1 and to_row == from_row + direction:
-            return to_pos in board_state and board_state[to_pos][0] != color
+        if PAWN_ATTACKS[side][from_sq] >> to_sq & 1:
+            return bool(position.occ[1 - side] >> to_sq & 1)
         
         return False
     
     @staticmethod
-    def is_valid_knight_move(board_state, from_pos, to_pos, color):
+    def is_valid_knight_move(position, from_sq, to_sq, side):
         """Validate knight moves"""
-        from_col, from_row = from_pos[0], int(from_pos[1])
-        to_col, to_row = to_pos[0], int(to_pos[1])
-        
-        dc = abs(ord(to_col) - ord(from_col))
-        dr = abs(to_row - from_row)
-        
-        # L-shape: 2+1 or 1+2
-        return (dc == 2 and dr == 1) or (dc == 1 and dr == 2)
+        # L-shape: 2+1 or 1+2, precomputed per square
+        return bool(KNIGHT_ATTACKS[from_sq] >> to_sq & 1)
     
     @staticmethod
-    def is_valid_bishop_move(board_state, from_pos, to_pos, color):
+    def is_valid_bishop_move(position, from_sq, to_sq, side):
         """Validate bishop moves"""
-        return ChessRules.is_diagonal_clear(board_state, from_pos, to_pos)
+        return ChessRules.is_diagonal_clear(position, from_sq, to_sq)
     
     @staticmethod
-    def is_valid_rook_move(board_state, from_pos, to_pos, color):
+    def is_valid_rook_move(position, from_sq, to_sq, side):
         """Validate rook moves"""
-        return ChessRules.is_straight_clear(board_state, from_pos, to_pos)
+        return ChessRules.is_straight_clear(position, from_sq, to_sq)
     
     @staticmethod
-    def is_valid_queen_move(board_state, from_pos, to_pos, color):
+    def is_valid_queen_move(position, from_sq, to_sq, side):
         """Validate queen moves (rook + bishop)"""
-        return (ChessRules.is_straight_clear(board_state, from_pos, to_pos) or
-                ChessRules.is_diagonal_clear(board_state, from_pos, to_pos))
+        return (ChessRules.is_straight_clear(position, from_sq, to_sq) or
+                ChessRules.is_diagonal_clear(position, from_sq, to_sq))
     
     @staticmethod
-    def is_valid_king_move(board_state, from_pos, to_pos, color):
+    def is_valid_king_move(position, from_sq, to_sq, side):
         """Validate king moves"""
-        from_col, from_row = from_pos[0], int(from_pos[1])
-        to_col, to_row = to_pos[0], int(to_pos[1])
-        
-        dc = abs(ord(to_col) - ord(from_col))
-        dr = abs(to_row - from_row)
-        
         # King moves one square in any direction
-        if dc <= 1 and dr <= 1:
-            # Check if destination is adjacent to enemy king
-            enemy_color = 'b' if color == 'w' else 'w'
-            enemy_king = f"{enemy_color}k"
-            
-            # Check all squares around destination
-            for ddc in [-1, 0, 1]:
-                for ddr in [-1, 0, 1]:
-                    if ddc == 0 and ddr == 0:
-                        continue
-                    check_col = chr(ord(to_col) + ddc)
-                    check_row = to_row + ddr
-                    if 'a' <= check_col <= 'h' and 1 <= check_row <= 8:
-                        check_pos = f"{check_col}{check_row}"
-                        if check_pos in board_state and board_state[check_pos] == enemy_king:
-                            return False  # Can't move adjacent to enemy king
-            
-            return True
+        if KING_ATTACKS[from_sq] >> to_sq & 1:
+            # Can't move adjacent to enemy king
+            enemy_king = position.bb[KING + (1 - side) * BLACK_OFFSET]
+            return not KING_ATTACKS[to_sq] & enemy_king
         
         # TODO: Castling (for future enhancement)
         return False
     
     @staticmethod
-    def is_straight_clear(board_state, from_pos, to_pos):
+    def is_straight_clear(position, from_sq, to_sq):
         """Check if path is clear for rook-like movement"""
-        from_col, from_row = from_pos[0], int(from_pos[1])
-        to_col, to_row = to_pos[0], int(to_pos[1])
-        
-        # Must be same row or same column
-        if from_col != to_col and from_row != to_row:
-            return False
-        
-        # Check path is clear
-        if from_col == to_col:  # Vertical
-            step = 1 if to_row > from_row else -1
-            for row in range(from_row + step, to_row, step):
-                if f"{from_col}{row}" in board_state:
-                    return False
-        else:  # Horizontal
-            step = 1 if ord(to_col) > ord(from_col) else -1
-            col = ord(from_col) + step
-            while col != ord(to_col):
-                if f"{chr(col)}{from_row}" in board_state:
-                    return False
-                col += step
-        
-        return True
+        # Same row or column with nothing in between: the rook attack
+        # set from from_sq stops at (and includes) the first piece
+        attacks = rook_attacks(from_sq, position.occ[0] | position.occ[1])
+        return bool(attacks >> to_sq & 1)
     
     @staticmethod
-    def is_diagonal_clear(board_state, from_pos, to_pos):
+    def is_diagonal_clear(position, from_sq, to_sq):
         """Check if path is clear for bishop-like movement"""
-        from_col, from_row = from_pos[0], int(from_pos[1])
-        to_col, to_row = to_pos[0], int(to_pos[1])
-        
-        dc = ord(to_col) - ord(from_col)
-        dr = to_row - from_row
-        
-        # Must be diagonal
-        if abs(dc) != abs(dr):
-            return False
-        
-        # Check path is clear
-        col_step = 1 if dc > 0 else -1
-        row_step = 1 if dr > 0 else -1
-        
-        steps = abs(dc)
-        for i in range(1, steps):
-            check_col = chr(ord(from_col) + i * col_step)
-            check_row = from_row + i * row_step
-            if f"{check_col}{check_row}" in board_state:
-                return False
-        
-        return True
+        attacks = bishop_attacks(from_sq, position.occ[0] | position.occ[1])
+        return bool(attacks >> to_sq & 1)
     
     @staticmethod
-    def is_move_legal_king_safety(board_state, from_pos, to_pos, color):
+    def is_move_legal_king_safety(position, from_sq, to_sq, side):
         """
         Check if move is legal considering king safety
-        Simulates move and checks if king is in check
+        Uses the checkers and pins of the position, no board copy
         """
-        # Simulate the move
-        test_board = dict(board_state)
-        piece = test_board[from_pos]
-        test_board[to_pos] = piece
-        del test_board[from_pos]
-        
-        # Normalize color
-        color_code = color[0] if len(color) > 1 else color
-        
-        # Find king position after move
-        king_piece = f"{color_code}k"
-        king_pos = None
-        for pos, p in test_board.items():
-            if p == king_piece:
-                king_pos = pos
-                break
-        
-        if not king_pos:
+        if position.kings[side] < 0:
             return False  # King not found (shouldn't happen)
-        
-        # Check if king is under attack
-        opponent_color = 'black' if color_code == 'w' else 'white'
-        return not ChessRules.is_square_under_attack(test_board, king_pos, opponent_color)
+
+        checkers, pins = compute_checkers_and_pins(position, side)
+        return is_legal(position, from_sq, to_sq, side, checkers, pins)
     
     @staticmethod
     def is_square_under_attack(board_state, square, by_color):
         """Check if a square is attacked by any piece of the given color"""
-        col, row = square[0], int(square[1])
-        by_color_code = by_color[0] if len(by_color) > 1 else by_color
-        
-        # Check for pawn attacks
-        # White pawns attack upward (from lower rows), black pawns attack downward
-        pawn_dir = -1 if by_color_code == 'w' else 1
-        for dc in [-1, 1]:
-            attack_col = chr(ord(col) + dc)
-            attack_row = row + pawn_dir
-            if 'a' <= attack_col <= 'h' and 1 <= attack_row <= 8:
-                attack_pos = f"{attack_col}{attack_row}"
-                if attack_pos in board_state and board_state[attack_pos] == f"{by_color_code}p":
-                    return True
-        
-        # Check for knight attacks
-        knight_moves = [
-            (2, 1), (2, -1), (-2, 1), (-2, -1),
-            (1, 2), (1, -2), (-1, 2), (-1, -2)
-        ]
-        for dc, dr in knight_moves:
-            attack_col = chr(ord(col) + dc)
-            attack_row = row + dr
-            if 'a' <= attack_col <= 'h' and 1 <= attack_row <= 8:
-                attack_pos = f"{attack_col}{attack_row}"
-                if attack_pos in board_state and board_state[attack_pos] == f"{by_color_code}n":
-                    return True
-        
-        # Check for king attacks
-        for dc in [-1, 0, 1]:
-            for dr in [-1, 0, 1]:
-                if dc == 0 and dr == 0:
-                    continue
-                attack_col = chr(ord(col) + dc)
-                attack_row = row + dr
-                if 'a' <= attack_col <= 'h' and 1 <= attack_row <= 8:
-                    attack_pos = f"{attack_col}{attack_row}"
-                    if attack_pos in board_state and board_state[attack_pos] == f"{by_color_code}k":
-                        return True
-        
-        # Check for sliding piece attacks
-        # Rook/Queen (straight lines)
-        for direction in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-            if ChessRules.check_sliding_attack(board_state, square, direction, by_color_code, ['r', 'q']):
-                return True
-        
-        # Bishop/Queen (diagonals)
-        for direction in [(1, 1), (1, -1), (-1, 1), (-1, -1)]:
-            if ChessRules.check_sliding_attack(board_state, square, direction, by_color_code, ['b', 'q']):
-                return True
-        
-        return False
-    
-    @staticmethod
-    def check_sliding_attack(board_state, square, direction, by_color_code, piece_types):
-        """Check for sliding piece attacks in a direction"""
-        col, row = square[0], int(square[1])
-        dc, dr = direction
-        
-        for i in range(1, 8):
-            new_col = chr(ord(col) + dc * i)
-            new_row = row + dr * i
-            if not ('a' <= new_col <= 'h' and 1 <= new_row <= 8):
-                break
-            
-            check_pos = f"{new_col}{new_row}"
-            if check_pos in board_state:
-                piece = board_state[check_pos]
-                if piece[0] == by_color_code and piece[1] in piece_types:
-                    return True
-                break  # Path blocked
-        
-        return False
+        position = Position.from_dict(board_state)
+        return is_square_attacked(position, SQ_INDEX[square], side_of(by_color))
     
     @staticmethod
     def is_in_check(board_state, color):
         """Check if the given color's king is in check"""
-        # Normalize color
-        color_code = color[0] if len(color) > 1 else color
-        
-        # Find king
-        king_piece = f"{color_code}k"
-        king_pos = None
-        for pos, piece in board_state.items():
-            if piece == king_piece:
-                king_pos = pos
-                break
-        
-        if not king_pos:
+        position = Position.from_dict(board_state)
+        side = side_of(color)
+
+        king_sq = position.kings[side]
+        if king_sq < 0:
             return False
-        
-        opponent_color = 'black' if color_code == 'w' else 'white'
-        return ChessRules.is_square_under_attack(board_state, king_pos, opponent_color)
+
+        return is_square_attacked(position, king_sq, 1 - side)
     
     @staticmethod
     def has_legal_moves(board_state, color):
         """Check if color has any legal moves (for checkmate/stalemate detection)"""
-        color_code = color[0] if len(color) > 1 else color
-        
-        for pos, piece in board_state.items():
-            if piece and piece[0] == color_code:
-                # Try all possible destinations
-                for file in 'abcdefgh':
-                    for rank in range(1, 9):
-                        to_pos = f"{file}{rank}"
-                        if to_pos != pos:  # Skip same square
-                            is_valid, _ = ChessRules.is_valid_move(board_state, pos, to_pos, color)
-                            if is_valid:
-                                return True
+        position = Position.from_dict(board_state)
+        side = side_of(color)
+        if position.kings[side] < 0:
+            return False
+
+        checkers, pins = compute_checkers_and_pins(position, side)
+        return ChessRules.position_has_legal_moves(position, side, checkers, pins)
+    
+    @staticmethod
+    def position_has_legal_moves(position, side, checkers, pins):
+        """has_legal_moves for a position whose checkers and pins are known"""
+        for _ in iter_legal_moves(position, side, checkers, pins):
+            return True
         return False
     
     @staticmethod
@@ -355,8 +205,20 @@ class ChessRules:
         winner: 'white', 'black', or None
         reason: description of end condition
         """
-        in_check = ChessRules.is_in_check(board_state, current_turn)
-        has_moves = ChessRules.has_legal_moves(board_state, current_turn)
+        return ChessRules.position_game_status(Position.from_dict(board_state), current_turn)
+    
+    @staticmethod
+    def position_game_status(position, current_turn):
+        """check_game_status for an already parsed position"""
+        # The king square comes with the position, and the checkers
+        # answer "in check?" for the legal move search too
+        side = side_of(current_turn)
+        if position.kings[side] < 0:
+            in_check = has_moves = False
+        else:
+            checkers, pins = compute_checkers_and_pins(position, side)
+            in_check = bool(checkers)
+            has_moves = ChessRules.position_has_legal_moves(position, side, checkers, pins)
         
         if not has_moves:
             if in_check:
@@ -368,7 +230,7 @@ class ChessRules:
                 return 'stalemate', None, 'Stalemate - No legal moves'
         
         # Check for insufficient material (basic check)
-        if ChessRules.is_insufficient_material(board_state):
+        if ChessRules.position_is_insufficient_material(position):
             return 'draw', None, 'Draw - Insufficient material'
         
         # Game continues
@@ -377,19 +239,64 @@ class ChessRules:
         
         return 'playing', None, None
     
+    @staticmethod
+    def apply_move(board_state, from_pos, to_pos, current_turn, promotion=None):
+        """
+        Validate a move, play it on board_state in place and find the
+        opponent's resulting status, all on one parsed position
+        Pawns promote to promotion ('q', 'r', 'b' or 'n'), a queen by default
+        Returns (error_message, None, None, None) or
+        (None, piece, captured, (status, winner, reason)) with the piece
+        as placed on to_pos
+        """
+        position = Position.from_dict(board_state)
+        is_valid, error_msg = ChessRules.is_valid_move(
+            board_state, from_pos, to_pos, current_turn, position
+        )
+        if not is_valid:
+            side = side_of(current_turn)
+            king_sq = position.kings[side]
+            if king_sq >= 0 and is_square_attacked(position, king_sq, 1 - side):
+                error_msg = "You are in check! You must escape check."
+            return error_msg, None, None, None
+        
+        piece = board_state[from_pos]
+        promotes = piece[1] == 'p' and to_pos[1] in '18'
+        if promotes:
+            piece = piece[0] + (promotion if promotion in ['q', 'r', 'b', 'n'] else 'q')
+        
+        captured = board_state.get(to_pos)
+        board_state[to_pos] = piece
+        del board_state[from_pos]
+        
+        if promotes and piece[1] != 'q':
+            # make() always promotes to a queen
+            position = Position.from_dict(board_state)
+        else:
+            position.make(SQ_INDEX[from_pos], SQ_INDEX[to_pos])
+        
+        next_turn = 'black' if piece[0] == 'w' else 'white'
+        return None, piece, captured, ChessRules.position_game_status(position, next_turn)
+    
     @staticmethod
     def is_insufficient_material(board_state):
         """Check for insufficient material to checkmate"""
-        pieces = list(board_state.values())
+        return ChessRules.position_is_insufficient_material(Position.from_dict(board_state))
+    
+    @staticmethod
+    def position_is_insufficient_material(position):
+        """is_insufficient_material on a bitboard position"""
+        total = (position.occ[0] | position.occ[1]).bit_count()
         
         # Only kings left
-        if len(pieces) == 2:
+        if total == 2:
             return True
         
         # King + minor piece vs King
-        if len(pieces) == 3:
-            piece_types = [p[1] for p in pieces]
-            if 'n' in piece_types or 'b' in piece_types:
+        if total == 3:
+            bb = position.bb
+            minors = bb[KNIGHT] | bb[BISHOP] | bb[KNIGHT + BLACK_OFFSET] | bb[BISHOP + BLACK_OFFSET]
+            if minors:
                 return True
         
         return False
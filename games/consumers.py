@@ -1,144 +1,330 @@
-import json
+import asyncio
+import base64
+import logging
+import multiprocessing
+import orjson
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from .models import GameRoom, ChatMessage, ChessGame
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from .bitboard import SQ_INDEX, pack_board
+from .chess_bot import ChessBot
+from .chess_rules import ChessRules
+from .models import GameRoom, ChatMessage, ChessGame, ChessMove
+from .signals import ROOM_PLAYERS_TIMEOUT, chess_games_changed, lobby_rooms_changed, room_players_key
+
+# Columns the chess consumer reads; anything else would be a lazy query
+GAME_FIELDS = (
+    'code', 'white_player_id', 'black_player_id', 'is_bot_game', 'bot_color',
+    'current_turn', 'board_state', 'status', 'winner',
+)
+
+# Enough to tell who is playing which color
+PLAYER_FIELDS = ('code', 'white_player_id', 'black_player_id')
+
+# Chat messages one user sends within this many seconds are sent together
+CHAT_BATCH_DELAY = 0.02
+
+# Chat rows of a room are saved together at most this many seconds late,
+# or as soon as this many are waiting
+CHAT_WRITE_DELAY = 0.2
+CHAT_WRITE_BATCH = 50
+
+# Seconds the chess bot "thinks" before it moves
+BOT_MOVE_DELAY = 2
+
+# Joins and leaves within this many seconds share one player_update
+PLAYER_UPDATE_DELAY = 0.05
+
+# Largest text frame a client may send, in characters
+MAX_FRAME_SIZE = 4096
+
+# Moves one connection may send per second; the rest are refused unread
+MAX_MOVES_PER_SECOND = 10
+
+logger = logging.getLogger(__name__)
+
+# Tasks started with run_in_background; the event loop only keeps weak
+# references to tasks, so they are held here until they finish
+background_tasks = set()
+
+
+def run_in_background(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_task_done)
+    return task
+
+
+def background_task_done(task):
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error('Background task %s failed', task.get_coro().__qualname__, exc_info=task.exception())
+
+
+# Worker processes for the bot search, created on first use; a few are
+# enough, each one is a whole interpreter
+BOT_WORKERS = 2
+bot_pool = None
+
+
+def get_bot_pool():
+    # The search is pure-Python CPU work; in a thread it would hold the GIL
+    # the event loop needs, in a process it runs on another core.
+    # spawn, because forking a process that already runs threads is unsafe
+    global bot_pool
+    if bot_pool is None:
+        bot_pool = ProcessPoolExecutor(
+            max_workers=BOT_WORKERS, mp_context=multiprocessing.get_context('spawn')
+        )
+    return bot_pool
+
+
+async def search_bot_move(board_state, color):
+    # A worker that dies (e.g. OOM-killed) breaks the whole pool for good,
+    # so replace a broken pool and search once more
+    loop = asyncio.get_running_loop()
+    global bot_pool
+    for attempt in range(2):
+        pool = get_bot_pool()
+        try:
+            return await loop.run_in_executor(pool, ChessBot.make_move, board_state, color)
+        except BrokenProcessPool:
+            if bot_pool is pool:
+                bot_pool = None
+                pool.shutdown(wait=False)
+            if attempt:
+                raise
+
+
+async def read_frame(consumer, text_data):
+    # Frames are small JSON text objects; anything oversized (1009),
+    # binary, empty or malformed (1003) closes the socket instead of
+    # raising out of the consumer
+    if not text_data:
+        await consumer.close(code=1003)
+        return None
+    if len(text_data) > MAX_FRAME_SIZE:
+        await consumer.close(code=1009)
+        return None
+    try:
+        data = orjson.loads(text_data)
+    except orjson.JSONDecodeError:
+        data = None
+    if not isinstance(data, dict):
+        await consumer.close(code=1003)
+        return None
+    return data
+
+
+def dumps(message):
+    # orjson encodes to bytes; the browser clients JSON.parse text frames
+    return orjson.dumps(message).decode()
+
+
+def encode_board(board_state):
+    # Chess boards travel as 32 packed bytes in base64 (unpackBoard in chess_game.html)
+    return base64.b64encode(pack_board(board_state)).decode()
 
 
 class GameConsumer(AsyncWebsocketConsumer):
+    # Scheduled player_update broadcasts, keyed by room group
+    pending_player_updates = {}
+    # Chat rows waiting to be saved, keyed by room code
+    pending_chat_rows = {}
+    # Open sockets per room group in this process
+    room_connections = {}
+    
     async def connect(self):
         self.room_code = self.scope['url_route']['kwargs']['room_code']
         self.room_group_name = f'game_{self.room_code}'
         self.user = self.scope['user']
+        self.chat_buffer = []
         
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+        connections = GameConsumer.room_connections
+        connections[self.room_group_name] = connections.get(self.room_group_name, 0) + 1
         await self.accept()
         await self.broadcast_players()
     
     async def disconnect(self, close_code):
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
-        await self.broadcast_players()
+        connections = GameConsumer.room_connections
+        remaining = connections.get(self.room_group_name, 0) - 1
+        if remaining > 0:
+            connections[self.room_group_name] = remaining
+            await self.broadcast_players()
+        else:
+            # Last socket gone: nobody is left to receive a player_update
+            connections.pop(self.room_group_name, None)
     
-    async def receive(self, text_data):
-        data = json.loads(text_data)
+    async def receive(self, text_data=None, bytes_data=None):
+        data = await read_frame(self, text_data)
+        if data is None:
+            return
         msg_type = data.get('type')
         
+        # Frames missing what their type needs are ignored
         if msg_type == 'chat':
-            await self.save_message(data['message'])
-            await self.channel_layer.group_send(self.room_group_name, {
-                'type': 'chat_message',
-                'message': data['message'],
-                'username': self.user.username
-            })
+            message = data.get('message')
+            if isinstance(message, str) and message:
+                self.queue_chat(message)
         elif msg_type == 'game_action':
-            await self.channel_layer.group_send(self.room_group_name, {
-                'type': 'game_update',
+            if 'action' not in data:
+                return
+            await self.broadcast({
+                'type': 'game_action',
                 'action': data['action'],
                 'data': data.get('data', {}),
                 'username': self.user.username
             })
         elif msg_type == 'start_game':
             await self.update_room_status('playing')
-            await self.channel_layer.group_send(self.room_group_name, {
+            await self.broadcast({
                 'type': 'game_started',
                 'username': self.user.username
             })
         elif msg_type == 'game_state':
+            if 'state' not in data:
+                return
             await self.save_game_state(data['state'])
-            await self.channel_layer.group_send(self.room_group_name, {
+            await self.broadcast({
                 'type': 'state_sync',
                 'state': data['state']
             })
     
-    async def chat_message(self, event):
-        await self.send(text_data=json.dumps({
+    def queue_chat(self, message):
+        # Messages sent within CHAT_BATCH_DELAY are joined line by line,
+        # so a burst is one saved row and one broadcast
+        self.chat_buffer.append(message)
+        if len(self.chat_buffer) == 1:
+            run_in_background(self.flush_chat())
+    
+    async def flush_chat(self):
+        await asyncio.sleep(CHAT_BATCH_DELAY)
+        messages, self.chat_buffer = self.chat_buffer, []
+        message = '\n'.join(messages)
+        self.save_message(message)
+        await self.broadcast({
             'type': 'chat',
-            'message': event['message'],
-            'username': event['username']
-        }))
-    
-    async def game_update(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'game_action',
-            'action': event['action'],
-            'data': event['data'],
-            'username': event['username']
-        }))
-    
-    async def game_started(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'game_started',
-            'username': event['username']
-        }))
+            'message': message,
+            'username': self.user.username
+        })
     
-    async def state_sync(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'state_sync',
-            'state': event['state']
-        }))
+    async def broadcast(self, message):
+        # Encode once here; every group member forwards the same text
+        await self.channel_layer.group_send(self.room_group_name, {
+            'type': 'forward_message',
+            'text': dumps(message)
+        })
     
-    async def player_update(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'player_update',
-            'players': event['players']
-        }))
+    async def forward_message(self, event):
+        await self.send(text_data=event['text'])
     
     async def broadcast_players(self):
+        # Debounced: a burst of joins/leaves in one room sends a single
+        # roster, read after the burst has settled
+        pending = GameConsumer.pending_player_updates
+        if self.room_group_name not in pending:
+            pending[self.room_group_name] = run_in_background(self.send_player_update())
+    
+    async def send_player_update(self):
+        try:
+            await asyncio.sleep(PLAYER_UPDATE_DELAY)
+        finally:
+            GameConsumer.pending_player_updates.pop(self.room_group_name, None)
+        if self.room_group_name not in GameConsumer.room_connections:
+            return
         players = await self.get_players()
-        await self.channel_layer.group_send(self.room_group_name, {
+        await self.broadcast({
             'type': 'player_update',
             'players': players
         })
     
-    @database_sync_to_async
-    def get_players(self):
-        try:
-            room = GameRoom.objects.get(code=self.room_code)
-            return list(room.players.values_list('username', flat=True))
-        except GameRoom.DoesNotExist:
-            return []
+    async def get_players(self):
+        # Served from the cache; signals.py drops the entry when the
+        # room's players change, so only the first lookup hits the database
+        key = room_players_key(self.room_code)
+        players = await cache.aget(key)
+        if players is None:
+            players = await self.load_players()
+            await cache.aset(key, players, ROOM_PLAYERS_TIMEOUT)
+        return players
     
     @database_sync_to_async
+    def load_players(self):
+        # One query; an unknown room code simply matches no users
+        return list(User.objects.filter(game_rooms__code=self.room_code).values_list('username', flat=True))
+    
     def save_message(self, content):
-        room = GameRoom.objects.get(code=self.room_code)
-        ChatMessage.objects.create(room=room, user=self.user, content=content)
+        # Buffered per room and written in one bulk INSERT by write_chat_rows;
+        # a full batch is written at once, so a flood can't pile rows up
+        pending = GameConsumer.pending_chat_rows
+        rows = pending.setdefault(self.room_code, [])
+        rows.append(ChatMessage(user=self.user, content=content))
+        if len(rows) >= CHAT_WRITE_BATCH:
+            del pending[self.room_code]
+            run_in_background(self.write_chat_rows(rows))
+        elif len(rows) == 1:
+            run_in_background(self.write_chat_rows_later(rows))
+    
+    async def write_chat_rows_later(self, rows):
+        await asyncio.sleep(CHAT_WRITE_DELAY)
+        # Unless the batch filled up and was written meanwhile
+        pending = GameConsumer.pending_chat_rows
+        if pending.get(self.room_code) is rows:
+            del pending[self.room_code]
+            await self.write_chat_rows(rows)
+    
+    async def write_chat_rows(self, rows):
+        try:
+            room = await GameRoom.objects.only('id').aget(code=self.room_code)
+        except GameRoom.DoesNotExist:
+            logger.warning('Room %s was deleted; dropping %d chat messages', self.room_code, len(rows))
+            return
+        for row in rows:
+            row.room = room
+        await ChatMessage.objects.abulk_create(rows)
     
     @database_sync_to_async
     def update_room_status(self, status):
-        room = GameRoom.objects.get(code=self.room_code)
-        room.status = status
-        room.save()
+        # Single UPDATE ... WHERE code = ..., no fetch and no full-row save;
+        # update() sends no post_save, so mark the lobby changed here
+        GameRoom.objects.filter(code=self.room_code).update(status=status)
+        lobby_rooms_changed()
     
-    @database_sync_to_async
-    def save_game_state(self, state):
-        room = GameRoom.objects.get(code=self.room_code)
-        room.game_state = state
-        room.save()
+    async def save_game_state(self, state):
+        await GameRoom.objects.filter(code=self.room_code).aupdate(game_state=state)
 
 
 class MatchmakingConsumer(AsyncWebsocketConsumer):
-    waiting_players = []
+    # Waiting queue keyed by channel name; dicts keep insertion order, so
+    # the first keys are the longest-waiting players
+    waiting_players = {}
     
     async def connect(self):
         self.user = self.scope['user']
         await self.channel_layer.group_add('matchmaking', self.channel_name)
         await self.accept()
-        MatchmakingConsumer.waiting_players.append({
+        MatchmakingConsumer.waiting_players[self.channel_name] = {
             'channel': self.channel_name,
             'user': self.user.username
-        })
+        }
         await self.try_match()
     
     async def disconnect(self, close_code):
         await self.channel_layer.group_discard('matchmaking', self.channel_name)
-        MatchmakingConsumer.waiting_players = [
-            p for p in MatchmakingConsumer.waiting_players 
-            if p['channel'] != self.channel_name
-        ]
+        MatchmakingConsumer.waiting_players.pop(self.channel_name, None)
     
     async def try_match(self):
-        if len(MatchmakingConsumer.waiting_players) >= 2:
-            p1 = MatchmakingConsumer.waiting_players.pop(0)
-            p2 = MatchmakingConsumer.waiting_players.pop(0)
+        waiting = MatchmakingConsumer.waiting_players
+        if len(waiting) >= 2:
+            p1 = waiting.pop(next(iter(waiting)))
+            p2 = waiting.pop(next(iter(waiting)))
             room = await self.create_match_room(p1['user'], p2['user'])
             for player in [p1, p2]:
                 await self.channel_layer.send(player['channel'], {
@@ -147,57 +333,60 @@ class MatchmakingConsumer(AsyncWebsocketConsumer):
                 })
     
     async def match_found(self, event):
-        await self.send(text_data=json.dumps({
+        await self.send(text_data=dumps({
             'type': 'match_found',
             'room_code': event['room_code']
         }))
     
     @database_sync_to_async
     def create_match_room(self, user1, user2):
-        from django.contrib.auth.models import User
         host = User.objects.get(username=user1)
         player2 = User.objects.get(username=user2)
-        room = GameRoom.objects.create(host=host, name=f"Match: {user1} vs {user2}", max_players=2)
-        room.players.add(host, player2)
+        with transaction.atomic():
+            room = GameRoom.objects.create(host=host, name=f"Match: {user1} vs {user2}", max_players=2)
+            # A new room has no members to check for, so both membership
+            # rows go in with one INSERT instead of players.add()
+            GameRoom.players.through.objects.bulk_create([
+                GameRoom.players.through(gameroom=room, user=host),
+                GameRoom.players.through(gameroom=room, user=player2),
+            ])
         return room
 
 
 # Chess Matchmaking Consumer - handles player vs player matching
 class ChessMatchmakingConsumer(AsyncWebsocketConsumer):
-    waiting_players = []
+    # Waiting queue keyed by user id (one entry per user), oldest first
+    waiting_players = {}
     
     async def connect(self):
         self.user = self.scope['user']
         await self.accept()
         
-        # Remove any existing entry for this user
-        ChessMatchmakingConsumer.waiting_players = [
-            p for p in ChessMatchmakingConsumer.waiting_players 
-            if p['user_id'] != self.user.id
-        ]
-        
-        # Add to waiting list
-        ChessMatchmakingConsumer.waiting_players.append({
+        # Replace any existing entry for this user, moving them to the back
+        waiting = ChessMatchmakingConsumer.waiting_players
+        waiting.pop(self.user.id, None)
+        waiting[self.user.id] = {
             'channel': self.channel_name,
             'user': self.user.username,
             'user_id': self.user.id
-        })
+        }
         
         # Try to match
         await self.try_match()
     
     async def disconnect(self, close_code):
-        # Remove from waiting list
-        ChessMatchmakingConsumer.waiting_players = [
-            p for p in ChessMatchmakingConsumer.waiting_players 
-            if p['channel'] != self.channel_name
-        ]
+        # Remove from waiting list, unless a newer connection replaced us
+        waiting = ChessMatchmakingConsumer.waiting_players
+        entry = waiting.get(self.user.id)
+        if entry and entry['channel'] == self.channel_name:
+            del waiting[self.user.id]
     
     async def try_match(self):
         # Need at least 2 players to match
-        if len(ChessMatchmakingConsumer.waiting_players) >= 2:
-            p1 = ChessMatchmakingConsumer.waiting_players.pop(0)
-            p2 = ChessMatchmakingConsumer.waiting_players.pop(0)
+        waiting = ChessMatchmakingConsumer.waiting_players
+        if len(waiting) >= 2:
+            p1 = waiting.pop(next(iter(waiting)))
+            p2 = waiting.pop(next(iter(waiting)))
             
             # Create game
             game = await self.create_chess_game(p1['user_id'], p2['user_id'])
@@ -210,21 +399,20 @@ class ChessMatchmakingConsumer(AsyncWebsocketConsumer):
                 })
         else:
             # Send waiting status
-            await self.send(text_data=json.dumps({
+            await self.send(text_data=dumps({
                 'type': 'waiting',
                 'message': 'Searching for opponent...',
                 'queue_position': len(ChessMatchmakingConsumer.waiting_players)
             }))
     
     async def match_found(self, event):
-        await self.send(text_data=json.dumps({
+        await self.send(text_data=dumps({
             'type': 'match_found',
             'game_code': event['game_code']
         }))
     
     @database_sync_to_async
     def create_chess_game(self, white_id, black_id):
-        from django.contrib.auth.models import User
         white_player = User.objects.get(id=white_id)
         black_player = User.objects.get(id=black_id)
         
@@ -243,6 +431,10 @@ class ChessGameConsumer(AsyncWebsocketConsumer):
         self.game_code = self.scope['url_route']['kwargs']['game_code']
         self.room_group_name = f'chess_{self.game_code}'
         self.user = self.scope['user']
+        self.pending_messages = []
+        self.player_color = None
+        self.move_window = 0.0
+        self.moves_in_window = 0
         
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
         await self.accept()
@@ -250,11 +442,32 @@ class ChessGameConsumer(AsyncWebsocketConsumer):
         # Send current game state
         await self.send_game_state()
     
+    def publish(self, message):
+        # Messages published together (a move's update plus its check,
+        # game_over or bot_thinking) go out as one frame
+        self.pending_messages.append(message)
+        if len(self.pending_messages) == 1:
+            run_in_background(self.flush_messages())
+    
+    async def flush_messages(self):
+        await asyncio.sleep(0)
+        messages, self.pending_messages = self.pending_messages, []
+        # Encoded once here; every player's consumer forwards the same text
+        await self.channel_layer.group_send(self.room_group_name, {
+            'type': 'forward_message',
+            'text': dumps(messages[0] if len(messages) == 1 else messages)
+        })
+    
+    async def forward_message(self, event):
+        await self.send(text_data=event['text'])
+    
     async def disconnect(self, close_code):
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
     
-    async def receive(self, text_data):
-        data = json.loads(text_data)
+    async def receive(self, text_data=None, bytes_data=None):
+        data = await read_frame(self, text_data)
+        if data is None:
+            return
         msg_type = data.get('type')
         
         if msg_type == 'move':
@@ -265,91 +478,44 @@ class ChessGameConsumer(AsyncWebsocketConsumer):
             await self.send_game_state()
     
     async def handle_move(self, data):
-        from_pos = data['from']
-        to_pos = data['to']
         promotion = data.get('promotion')  # 'q', 'r', 'b', 'n' for pawn promotion
         
-        game = await self.get_game()
-        if not game:
-            await self.send(text_data=json.dumps({'type': 'error', 'message': 'Game not found'}))
+        # Move spam and malformed squares are answered without a database hop
+        now = asyncio.get_running_loop().time()
+        if now - self.move_window >= 1:
+            self.move_window = now
+            self.moves_in_window = 0
+        self.moves_in_window += 1
+        if self.moves_in_window > MAX_MOVES_PER_SECOND:
+            await self.send(text_data=dumps({'type': 'error', 'message': 'Too many moves'}))
             return
-        
-        # Validate turn
-        player_color = await self.get_player_color(game)
-        if not player_color:
-            await self.send(text_data=json.dumps({'type': 'error', 'message': 'Not a player in this game'}))
-            return
-            
-        if game.current_turn != player_color:
-            await self.send(text_data=json.dumps({'type': 'error', 'message': 'Not your turn'}))
+        from_pos, to_pos = data.get('from'), data.get('to')
+        if not (isinstance(from_pos, str) and isinstance(to_pos, str)
+                and from_pos in SQ_INDEX and to_pos in SQ_INDEX):
+            await self.send(text_data=dumps({'type': 'error', 'message': 'Illegal move: Not a square'}))
             return
         
-        # COMPREHENSIVE MOVE VALIDATION using chess rules engine
-        # This includes:
-        # - Piece movement rules
-        # - King safety (cannot leave king in check)
-        # - Check escape validation (if in check, move must resolve it)
-        from .chess_rules import ChessRules
-        is_valid, error_msg = ChessRules.is_valid_move(
-            game.board_state, 
-            from_pos, 
-            to_pos, 
-            game.current_turn
-        )
-        
-        if not is_valid:
-            # Check if player is in check and trying invalid move
-            if ChessRules.is_in_check(game.board_state, game.current_turn):
-                error_msg = "You are in check! You must escape check."
-            
-            await self.send(text_data=json.dumps({
-                'type': 'error', 
-                'message': f'Illegal move: {error_msg}'
-            }))
+        # Validation, the move itself and the save are one thread hop
+        error_msg, result = await self.apply_move(from_pos, to_pos, promotion)
+        if error_msg:
+            await self.send(text_data=dumps({'type': 'error', 'message': error_msg}))
             return
         
-        # Execute move (only if validation passed)
-        board = game.board_state
-        piece = board[from_pos]
-        
-        # Handle pawn promotion
-        if piece[1] == 'p':
-            to_rank = int(to_pos[1])
-            color_code = piece[0]
-            # Check if pawn reached promotion rank
-            if (color_code == 'w' and to_rank == 8) or (color_code == 'b' and to_rank == 1):
-                # Promote pawn to chosen piece (default to queen if not specified)
-                promote_to = promotion if promotion in ['q', 'r', 'b', 'n'] else 'q'
-                piece = f"{color_code}{promote_to}"
-        
-        board[to_pos] = piece
-        del board[from_pos]
+        game = result['game']
+        move = result['move']
+        next_turn = game.current_turn
+        game_status, winner, reason = result['status']
         
-        # Update game state
-        next_turn = 'black' if game.current_turn == 'white' else 'white'
-        move_history = list(game.move_history) if game.move_history else []
-        move_history.append({'from': from_pos, 'to': to_pos, 'piece': piece, 'promotion': promotion})
-        
-        # CHECK FOR END-GAME CONDITIONS (checkmate, stalemate, draw)
-        game_status, winner, reason = ChessRules.check_game_status(board, next_turn)
-        
-        # Update game in database
-        if game_status in ['checkmate', 'stalemate', 'draw']:
-            await self.finish_game(game.code, winner, game_status)
-        else:
-            await self.update_game(game.code, board, next_turn, move_history)
-        
-        # Broadcast move to all players
-        await self.channel_layer.group_send(self.room_group_name, {
+        # Broadcast only the move; clients patch their board with it
+        self.publish({
             'type': 'game_update',
-            'board_state': board,
             'current_turn': next_turn,
-            'move': {'from': from_pos, 'to': to_pos, 'piece': piece}
+            'move': move
         })
         
         # Handle end-game notification
         if game_status in ['checkmate', 'stalemate', 'draw']:
-            await self.channel_layer.group_send(self.room_group_name, {
+            self.publish({
                 'type': 'game_over',
                 'status': game_status,
                 'winner': winner,
@@ -359,8 +525,8 @@ class ChessGameConsumer(AsyncWebsocketConsumer):
         
         # Notify if in check
         if game_status == 'check':
-            await self.channel_layer.group_send(self.room_group_name, {
-                'type': 'check_notification',
+            self.publish({
+                'type': 'check',
                 'color': next_turn
             })
         
@@ -368,49 +534,129 @@ class ChessGameConsumer(AsyncWebsocketConsumer):
         # Bot should move when it's playing OR when it's in check (must escape)
         if game.is_bot_game and next_turn == game.bot_color and game_status in ['playing', 'check']:
             # Notify UI that bot is thinking
-            await self.channel_layer.group_send(self.room_group_name, {
+            self.publish({
                 'type': 'bot_thinking',
                 'thinking': True
             })
-            # Schedule bot move as background task (doesn't block user's move)
-            import asyncio
-            asyncio.create_task(self.make_bot_move(game.code))
-    
-    async def make_bot_move(self, game_code):
-        import asyncio
-        from .chess_bot import ChessBot
-        from .chess_rules import ChessRules
-        
-        try:
-            # Bot thinks for exactly 2 seconds
-            await asyncio.sleep(2)
+            # Start the search now in a worker process and play its result once
+            # the thinking delay is up, so the search time is hidden inside
+            # the delay; until then the move is only a timer-heap entry
+            loop = asyncio.get_running_loop()
+            search = asyncio.ensure_future(search_bot_move(game.board_state, next_turn))
+            game_code = game.code
+            loop.call_later(
+                BOT_MOVE_DELAY, lambda: run_in_background(self.make_bot_move(game_code, search))
+            )
+    
+    @database_sync_to_async
+    def apply_move(self, from_pos, to_pos, promotion):
+        """
+        Validate and play a player's move in one transaction
+        Returns (error_message, None) or (None, {'game', 'move', 'status'})
+        """
+        with transaction.atomic():
+            try:
+                game = ChessGame.objects.select_for_update().only(*GAME_FIELDS).get(code=self.game_code)
+            except ChessGame.DoesNotExist:
+                return 'Game not found', None
             
-            game = await self.get_game_by_code(game_code)
-            if not game or game.status != 'playing':
-                return
+            # Validate turn
+            player_color = self.get_player_color(game)
+            if not player_color:
+                return 'Not a player in this game', None
+            
+            if game.current_turn != player_color:
+                return 'Not your turn', None
+            
+            return self.play_move(game, from_pos, to_pos, promotion)
+    
+    @database_sync_to_async
+    def apply_bot_move(self, game_code, move):
+        """
+        Play the bot's searched move in one transaction, unless the game
+        moved on (e.g. the player resigned) while it was thinking
+        Returns like apply_move; 'move' is None if the bot had no move
+        """
+        with transaction.atomic():
+            try:
+                game = ChessGame.objects.select_for_update().only(*GAME_FIELDS).get(code=game_code)
+            except ChessGame.DoesNotExist:
+                return 'Game not found', None
             
             # Ensure it's actually the bot's turn
-            if game.current_turn != game.bot_color:
-                return
+            if game.status != 'playing' or game.current_turn != game.bot_color:
+                return "Not the bot's turn", None
+            
+            if not move:
+                # Bot has no legal moves - check for checkmate or stalemate
+                status = ChessRules.check_game_status(game.board_state, game.current_turn)
+                game_status, winner, _ = status
+                
+                # Only end game if it's actually checkmate or stalemate
+                if game_status in ['checkmate', 'stalemate', 'draw']:
+                    game.status = game_status
+                    game.winner = winner
+                    game.save(update_fields=['status', 'winner', 'updated_at'])
+                return None, {'game': game, 'move': None, 'status': status}
             
-            # Get legal move from bot using current_turn (should match bot_color)
-            move = ChessBot.make_move(game.board_state, game.current_turn)
-        except Exception as e:
-            print(f"Bot move error: {e}")
+            from_pos, to_pos = move
+            return self.play_move(game, from_pos, to_pos, bot=True)
+    
+    def play_move(self, game, from_pos, to_pos, promotion=None, bot=False):
+        """
+        Validate a move on a locked game, apply it and save the game
+        The bot always promotes to a queen
+        """
+        # Validation covers piece movement rules and king safety (cannot
+        # leave or stay in check); the rules engine then plays the move
+        # and reports the opponent's status from the same position
+        moved = game.board_state.get(from_pos)
+        error_msg, piece, captured, status = ChessRules.apply_move(
+            game.board_state, from_pos, to_pos, game.current_turn, promotion
+        )
+        if error_msg:
+            return f'Illegal move: {error_msg}', None
+        
+        # Update game state; the move itself is one new ChessMove row,
+        # with the piece a pawn actually promoted to, not what was asked
+        game.current_turn = 'black' if game.current_turn == 'white' else 'white'
+        ChessMove.objects.create(
+            game=game, from_pos=from_pos, to_pos=to_pos, piece=piece,
+            promotion=piece[1] if piece != moved else None, is_bot=bot
+        )
+        game_status, winner, _ = status
+        
+        # Update game in database
+        if game_status in ['checkmate', 'stalemate', 'draw']:
+            game.status = game_status
+            game.winner = winner
+        game.save(update_fields=['board_state', 'current_turn', 'status', 'winner', 'updated_at'])
+        
+        move = {'from': from_pos, 'to': to_pos, 'piece': piece, 'captured': captured}
+        if bot:
+            move['bot'] = True
+        return None, {'game': game, 'move': move, 'status': status}
+    
+    async def make_bot_move(self, game_code, search):
+        try:
+            # Bot's move, searched in a worker process since the player moved
+            move = await search
+            error_msg, result = await self.apply_bot_move(game_code, move)
+        except Exception:
+            logger.exception('Bot move error in game %s', game_code)
             return
         
-        if not move:
-            # Bot has no legal moves - check for checkmate or stalemate
-            game_status, winner, reason = ChessRules.check_game_status(
-                game.board_state, 
-                game.current_turn
-            )
-            
-            # Only end game if it's actually checkmate or stalemate
+        if error_msg:
+            # Game over or not the bot's turn any more, or the bot generated
+            # an invalid move - skip turn (shouldn't happen)
+            return
+        
+        game_status, winner, reason = result['status']
+        next_turn = result['game'].current_turn
+        
+        if not result['move']:
             if game_status in ['checkmate', 'stalemate', 'draw']:
-                await self.finish_game(game_code, winner, game_status)
-                
-                await self.channel_layer.group_send(self.room_group_name, {
+                self.publish({
                     'type': 'game_over',
                     'status': game_status,
                     'winner': winner,
@@ -418,127 +664,63 @@ class ChessGameConsumer(AsyncWebsocketConsumer):
                 })
             else:
                 # Bot couldn't find a move but game isn't over - this shouldn't happen
-                # Try to find ANY legal move as fallback
-                print(f"Bot failed to find move but game status is: {game_status}")
+                logger.warning('Bot found no move in game %s but its status is %s', game_code, game_status)
                 # Notify that bot is stuck (for debugging)
-                await self.channel_layer.group_send(self.room_group_name, {
+                self.publish({
                     'type': 'bot_thinking',
                     'thinking': False
                 })
             return
         
-        if move:
-            from_pos, to_pos = move
-            
-            # Double-check move validity with rules engine (safety check)
-            is_valid, _ = ChessRules.is_valid_move(
-                game.board_state,
-                from_pos,
-                to_pos,
-                game.current_turn
-            )
-            
-            if not is_valid:
-                # Bot generated invalid move - skip turn (shouldn't happen)
-                return
-            
-            # Execute validated move
-            board = game.board_state
-            piece = board[from_pos]
-            
-            # Handle bot pawn promotion (always promote to queen)
-            if piece[1] == 'p':
-                to_rank = int(to_pos[1])
-                color_code = piece[0]
-                if (color_code == 'w' and to_rank == 8) or (color_code == 'b' and to_rank == 1):
-                    piece = f"{color_code}q"  # Bot always promotes to queen
-            
-            board[to_pos] = piece
-            del board[from_pos]
-            
-            next_turn = 'white' if game.current_turn == 'black' else 'black'
-            move_history = list(game.move_history) if game.move_history else []
-            move_history.append({'from': from_pos, 'to': to_pos, 'piece': piece, 'bot': True})
-            
-            # CHECK FOR END-GAME CONDITIONS after bot move
-            game_status, winner, reason = ChessRules.check_game_status(board, next_turn)
-            
-            # Update game in database
-            if game_status in ['checkmate', 'stalemate', 'draw']:
-                await self.finish_game(game_code, winner, game_status)
-            else:
-                await self.update_game(game_code, board, next_turn, move_history)
-            
-            # Broadcast bot's move
-            await self.channel_layer.group_send(self.room_group_name, {
-                'type': 'game_update',
-                'board_state': board,
-                'current_turn': next_turn,
-                'move': {'from': from_pos, 'to': to_pos, 'piece': piece, 'bot': True}
+        # Broadcast bot's move
+        self.publish({
+            'type': 'game_update',
+            'current_turn': next_turn,
+            'move': result['move']
+        })
+        
+        # Handle end-game notification
+        if game_status in ['checkmate', 'stalemate', 'draw']:
+            self.publish({
+                'type': 'game_over',
+                'status': game_status,
+                'winner': winner,
+                'reason': reason
+            })
+        elif game_status == 'check':
+            # Notify if bot put player in check
+            self.publish({
+                'type': 'check',
+                'color': next_turn
             })
-            
-            # Handle end-game notification
-            if game_status in ['checkmate', 'stalemate', 'draw']:
-                await self.channel_layer.group_send(self.room_group_name, {
-                    'type': 'game_over',
-                    'status': game_status,
-                    'winner': winner,
-                    'reason': reason
-                })
-            elif game_status == 'check':
-                # Notify if bot put player in check
-                await self.channel_layer.group_send(self.room_group_name, {
-                    'type': 'check_notification',
-                    'color': next_turn
-                })
     
     async def handle_resign(self):
-        game = await self.get_game()
+        # Only the player columns are needed, not the board or history
+        game = await self.get_game(PLAYER_FIELDS)
         if not game:
             return
         
-        player_color = await self.get_player_color(game)
+        player_color = self.get_player_color(game)
         if not player_color:
             return
         
         winner = 'black' if player_color == 'white' else 'white'
         await self.finish_game(game.code, winner)
         
-        await self.channel_layer.group_send(self.room_group_name, {
+        self.publish({
             'type': 'game_over',
+            'status': 'finished',
             'winner': winner,
             'reason': 'resignation'
         })
     
-    async def game_update(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'game_update',
-            'board_state': event['board_state'],
-            'current_turn': event['current_turn'],
-            'move': event['move']
-        }))
-    
-    async def bot_thinking(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'bot_thinking',
-            'thinking': event['thinking']
-        }))
-    
-    async def game_over(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'game_over',
-            'status': event.get('status', 'finished'),
-            'winner': event['winner'],
-            'reason': event['reason']
-        }))
-    
     async def send_game_state(self):
         game = await self.get_game()
         if game:
-            player_color = await self.get_player_color(game)
-            await self.send(text_data=json.dumps({
+            player_color = self.get_player_color(game)
+            await self.send(text_data=dumps({
                 'type': 'game_state',
-                'board_state': game.board_state,
+                'board': encode_board(game.board_state),
                 'current_turn': game.current_turn,
                 'is_bot_game': game.is_bot_game,
                 'bot_color': game.bot_color,
@@ -547,47 +729,32 @@ class ChessGameConsumer(AsyncWebsocketConsumer):
             }))
     
     @database_sync_to_async
-    def get_game(self):
+    def get_game(self, fields=GAME_FIELDS):
         try:
-            return ChessGame.objects.get(code=self.game_code)
+            return ChessGame.objects.only(*fields).get(code=self.game_code)
         except ChessGame.DoesNotExist:
             return None
     
-    @database_sync_to_async
-    def get_game_by_code(self, code):
-        try:
-            return ChessGame.objects.get(code=code)
-        except ChessGame.DoesNotExist:
-            return None
-    
-    @database_sync_to_async
     def get_player_color(self, game):
+        # A player's color is fixed once set, so remember it per connection
+        if self.player_color:
+            return self.player_color
+        self.player_color = self.resolve_player_color(game)
+        return self.player_color
+    
+    def resolve_player_color(self, game):
+        # Plain attribute reads on the fetched game, no database access
         if game.white_player_id == self.user.id:
             return 'white'
         elif game.black_player_id == self.user.id:
             return 'black'
-        # For bot games, if user is white player
-        elif game.is_bot_game and game.white_player_id == self.user.id:
-            return 'white'
         return None
     
-    @database_sync_to_async
-    def update_game(self, code, board_state, current_turn, move_history):
-        game = ChessGame.objects.get(code=code)
-        game.board_state = board_state
-        game.current_turn = current_turn
-        game.move_history = move_history
-        game.save()
-    
     @database_sync_to_async
     def finish_game(self, code, winner, status='finished'):
-        game = ChessGame.objects.get(code=code)
-        game.status = status if status in ['checkmate', 'stalemate', 'draw'] else 'finished'
-        game.winner = winner
-        game.save()
-    
-    async def check_notification(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'check',
-            'color': event['color']
-        }))
+        ChessGame.objects.filter(code=code).update(
+            status=status if status in ['checkmate', 'stalemate', 'draw'] else 'finished',
+            winner=winner,
+            updated_at=timezone.now()
+        )
+        chess_games_changed()
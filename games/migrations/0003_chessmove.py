@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-15 01:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0002_chessgame'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChessMove',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_pos', models.CharField(max_length=2)),
+                ('to_pos', models.CharField(max_length=2)),
+                ('piece', models.CharField(max_length=2)),
+                ('promotion', models.CharField(blank=True, max_length=1, null=True)),
+                ('is_bot', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='moves', to='games.chessgame')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
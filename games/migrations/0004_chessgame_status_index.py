@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-15 01:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0003_chessmove'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chessgame',
+            index=models.Index(fields=['status', '-created_at'], name='chessgame_status_created_idx'),
+        ),
+    ]
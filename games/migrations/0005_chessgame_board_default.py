@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-15 01:19
+
+import games.models
+from django.db import migrations, models
+
+
+def copy_move_history(apps, schema_editor):
+    # Games from before ChessMove only have their moves in move_history
+    ChessGame = apps.get_model('games', 'ChessGame')
+    ChessMove = apps.get_model('games', 'ChessMove')
+    rows = []
+    for game in ChessGame.objects.filter(moves__isnull=True).exclude(move_history=[]):
+        for move in game.move_history:
+            # The old history kept whatever the client sent as promotion
+            promotion = move.get('promotion')
+            if not (promotion in ('q', 'r', 'b', 'n') and move['piece'][1] == promotion
+                    and move['to'][1] in '18'):
+                promotion = None
+            rows.append(ChessMove(
+                game=game, from_pos=move['from'], to_pos=move['to'], piece=move['piece'],
+                promotion=promotion, is_bot=bool(move.get('bot')),
+            ))
+    # In list order, so the ids keep the moves in the order they were played
+    ChessMove.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0004_chessgame_status_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_move_history, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='chessgame',
+            name='move_history',
+        ),
+        migrations.AlterField(
+            model_name='chessgame',
+            name='board_state',
+            field=models.JSONField(default=games.models.initial_board),
+        ),
+    ]
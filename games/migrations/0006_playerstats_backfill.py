@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def create_missing_stats(apps, schema_editor):
+    # Users made before stats were created on signup
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    PlayerStats = apps.get_model('games', 'PlayerStats')
+    PlayerStats.objects.bulk_create([
+        PlayerStats(user_id=user_id)
+        for user_id in User.objects.filter(stats__isnull=True).values_list('id', flat=True)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0005_chessgame_board_default'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_stats, migrations.RunPython.noop),
+    ]
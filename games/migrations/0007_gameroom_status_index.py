@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-15 01:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0006_playerstats_backfill'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='gameroom',
+            index=models.Index(fields=['status', '-created_at'], name='gameroom_status_created_idx'),
+        ),
+    ]
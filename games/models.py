@@ -2,6 +2,14 @@ from django.db import models
 from django.contrib.auth.models import User
 import uuid
 
+def initial_board():
+    return {
+        'a8': 'br', 'b8': 'bn', 'c8': 'bb', 'd8': 'bq', 'e8': 'bk', 'f8': 'bb', 'g8': 'bn', 'h8': 'br',
+        'a7': 'bp', 'b7': 'bp', 'c7': 'bp', 'd7': 'bp', 'e7': 'bp', 'f7': 'bp', 'g7': 'bp', 'h7': 'bp',
+        'a2': 'wp', 'b2': 'wp', 'c2': 'wp', 'd2': 'wp', 'e2': 'wp', 'f2': 'wp', 'g2': 'wp', 'h2': 'wp',
+        'a1': 'wr', 'b1': 'wn', 'c1': 'wb', 'd1': 'wq', 'e1': 'wk', 'f1': 'wb', 'g1': 'wn', 'h1': 'wr',
+    }
+
 class GameRoom(models.Model):
     STATUS_CHOICES = [
         ('waiting', 'Waiting'),
@@ -18,6 +26,10 @@ class GameRoom(models.Model):
     game_state = models.JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        # lobby and matchmaking look for the newest rooms with a given status
+        indexes = [models.Index(fields=['status', '-created_at'], name='gameroom_status_created_idx')]
+    
     def save(self, *args, **kwargs):
         if not self.code:
             self.code = uuid.uuid4().hex[:8].upper()
@@ -39,31 +51,39 @@ class ChessGame(models.Model):
     is_bot_game = models.BooleanField(default=False)
     bot_color = models.CharField(max_length=5, choices=[('white', 'White'), ('black', 'Black')], null=True, blank=True)
     current_turn = models.CharField(max_length=5, default='white')
-    board_state = models.JSONField(default=dict)
-    move_history = models.JSONField(default=list)
+    board_state = models.JSONField(default=initial_board)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='waiting')
     winner = models.CharField(max_length=20, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        # chess_lobby lists the newest games with a given status
+        indexes = [models.Index(fields=['status', '-created_at'], name='chessgame_status_created_idx')]
+    
     def save(self, *args, **kwargs):
         if not self.code:
             self.code = uuid.uuid4().hex[:8].upper()
-        if not self.board_state:
-            self.board_state = self.initialize_board()
         super().save(*args, **kwargs)
     
-    def initialize_board(self):
-        return {
-            'a8': 'br', 'b8': 'bn', 'c8': 'bb', 'd8': 'bq', 'e8': 'bk', 'f8': 'bb', 'g8': 'bn', 'h8': 'br',
-            'a7': 'bp', 'b7': 'bp', 'c7': 'bp', 'd7': 'bp', 'e7': 'bp', 'f7': 'bp', 'g7': 'bp', 'h7': 'bp',
-            'a2': 'wp', 'b2': 'wp', 'c2': 'wp', 'd2': 'wp', 'e2': 'wp', 'f2': 'wp', 'g2': 'wp', 'h2': 'wp',
-            'a1': 'wr', 'b1': 'wn', 'c1': 'wb', 'd1': 'wq', 'e1': 'wk', 'f1': 'wb', 'g1': 'wn', 'h1': 'wr',
-        }
-    
     def __str__(self):
         return f"Chess {self.code} - {self.status}"
 
+class ChessMove(models.Model):
+    game = models.ForeignKey(ChessGame, on_delete=models.CASCADE, related_name='moves')
+    from_pos = models.CharField(max_length=2)
+    to_pos = models.CharField(max_length=2)
+    piece = models.CharField(max_length=2)
+    promotion = models.CharField(max_length=1, null=True, blank=True)
+    is_bot = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['id']
+    
+    def __str__(self):
+        return f"{self.piece} {self.from_pos}-{self.to_pos}"
+
 class ChatMessage(models.Model):
     room = models.ForeignKey(GameRoom, on_delete=models.CASCADE, related_name='messages')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -0,0 +1,95 @@
+import time
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from .models import ChessGame, GameRoom, PlayerStats
+
+# Cached player lists expire on their own too, so edits that bypass the
+# signals below (e.g. deleting a user) can't leave a room stale for long
+ROOM_PLAYERS_TIMEOUT = 300
+
+
+def room_players_key(room_code):
+    return f'game_{room_code}_players'
+
+
+# The lobby's waiting rooms; dropped whenever a room or its players change
+LOBBY_ROOMS_KEY = 'lobby_rooms'
+LOBBY_ROOMS_TIMEOUT = 30
+
+# When the lobby and chess lobby pages last changed, for their ETags
+LOBBY_CHANGED_KEY = 'lobby_changed'
+CHESS_LOBBY_CHANGED_KEY = 'chess_lobby_changed'
+
+
+# When a user's stats last changed, for the lobby's ETag
+def stats_changed_key(user_id):
+    return f'player_{user_id}_stats_changed'
+
+
+def changed_at(key):
+    return cache.get_or_set(key, time.time, None)
+
+
+def lobby_rooms_changed():
+    # Also called where rooms are changed with update(), which sends no
+    # signal. Deferred to commit: a lobby request in between would
+    # otherwise get the new ETag and re-cache the old rooms
+    def drop():
+        cache.delete(LOBBY_ROOMS_KEY)
+        cache.set(LOBBY_CHANGED_KEY, time.time(), None)
+    transaction.on_commit(drop)
+
+
+def chess_games_changed():
+    transaction.on_commit(lambda: cache.set(CHESS_LOBBY_CHANGED_KEY, time.time(), None))
+
+
+@receiver(m2m_changed, sender=GameRoom.players.through)
+def room_players_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    lobby_rooms_changed()
+    # Dropped after commit, so a consumer loading players in between
+    # can't cache the old list again
+    if not reverse:
+        key = room_players_key(instance.code)
+        transaction.on_commit(lambda: cache.delete(key))
+    elif pk_set:
+        # Changed from the user side: instance is a User, pk_set the rooms
+        codes = GameRoom.objects.filter(pk__in=pk_set).values_list('code', flat=True)
+        keys = [room_players_key(code) for code in codes]
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+@receiver(post_save, sender=GameRoom)
+def room_saved(sender, instance, **kwargs):
+    lobby_rooms_changed()
+
+
+@receiver(post_delete, sender=GameRoom)
+def room_deleted(sender, instance, **kwargs):
+    key = room_players_key(instance.code)
+    transaction.on_commit(lambda: cache.delete(key))
+    lobby_rooms_changed()
+
+
+@receiver(post_save, sender=ChessGame)
+def chess_game_saved(sender, instance, **kwargs):
+    chess_games_changed()
+
+
+@receiver(post_save, sender=PlayerStats)
+def player_stats_saved(sender, instance, **kwargs):
+    key = stats_changed_key(instance.user_id)
+    transaction.on_commit(lambda: cache.set(key, time.time(), None))
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, **kwargs):
+    # Every user has stats from the start, so views never check for them;
+    # fixtures (raw saves) bring their own
+    if created and not kwargs.get('raw'):
+        PlayerStats.objects.create(user=instance)
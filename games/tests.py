@@ -0,0 +1,569 @@
+import asyncio
+import json
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
+from datetime import timedelta
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.http import Http404
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .bitboard import (
+    BISHOP_DIRECTIONS, ROOK_DIRECTIONS, SQ_NAMES, Position,
+    _ray_attacks, bishop_attacks, generate_legal_moves, rook_attacks,
+)
+from .chess_rules import ChessRules
+from . import consumers
+from .models import ChatMessage, ChessGame, GameRoom, PlayerStats, initial_board
+from .routing import websocket_urlpatterns
+from .signals import LOBBY_ROOMS_KEY, room_players_key
+from .views import claim_seat, give_up_seat, take_seat
+
+
+def perft(position, side, depth):
+    """Count the leaf nodes of the legal move tree depth plies deep"""
+    moves = generate_legal_moves(position, side)
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for from_sq, to_sq in moves:
+        piece, captured = position.make(from_sq, to_sq)
+        nodes += perft(position, side ^ 1, depth - 1)
+        position.unmake(from_sq, to_sq, piece, captured)
+    return nodes
+
+
+class SliderAttackTests(SimpleTestCase):
+    """The magic tables must agree with a plain ray walk"""
+
+    def test_magic_tables_match_ray_walk(self):
+        rng = random.Random(1)
+        for sq in range(64):
+            for _ in range(200):
+                # Sparse boards reach the long rays, dense ones the blockers
+                occupied = rng.getrandbits(64) & rng.getrandbits(64)
+                self.assertEqual(rook_attacks(sq, occupied), _ray_attacks(sq, occupied, ROOK_DIRECTIONS))
+                self.assertEqual(bishop_attacks(sq, occupied), _ray_attacks(sq, occupied, BISHOP_DIRECTIONS))
+
+
+class MoveGenerationTests(SimpleTestCase):
+
+    def test_perft_from_start(self):
+        # No castling, en passant or promotion can happen this early, so
+        # these are the standard counts
+        position = Position.from_dict(initial_board())
+        for depth, nodes in ((1, 20), (2, 400), (3, 8902)):
+            self.assertEqual(perft(position, 0, depth), nodes)
+        self.assertEqual(position.mailbox, Position.from_dict(initial_board()).mailbox)
+
+    def test_generator_matches_is_valid_move(self):
+        # Random games: every position's generated moves must be exactly
+        # the moves is_valid_move accepts
+        rng = random.Random(2)
+        for _ in range(5):
+            board = initial_board()
+            turn = 'white'
+            for _ in range(40):
+                position = Position.from_dict(board)
+                generated = {
+                    (SQ_NAMES[f], SQ_NAMES[t])
+                    for f, t in generate_legal_moves(position, 0 if turn == 'white' else 1)
+                }
+                accepted = {
+                    (f, t)
+                    for f in board if board[f][0] == turn[0]
+                    for t in SQ_NAMES
+                    if ChessRules.is_valid_move(board, f, t, turn, position)[0]
+                }
+                self.assertEqual(generated, accepted)
+                if not generated:
+                    break
+                from_pos, to_pos = rng.choice(sorted(generated))
+                error, _, _, status = ChessRules.apply_move(board, from_pos, to_pos, turn)
+                self.assertIsNone(error)
+                turn = 'black' if turn == 'white' else 'white'
+                if status[0] in ('checkmate', 'stalemate', 'draw'):
+                    break
+
+
+class GameStatusTests(SimpleTestCase):
+
+    def test_fools_mate(self):
+        board = initial_board()
+        for from_pos, to_pos in (('f2', 'f3'), ('e7', 'e5'), ('g2', 'g4'), ('d8', 'h4')):
+            board[to_pos] = board.pop(from_pos)
+        self.assertEqual(ChessRules.check_game_status(board, 'white'), ('checkmate', 'black', 'Checkmate'))
+
+    def test_stalemate(self):
+        board = {'a8': 'bk', 'b6': 'wq', 'c6': 'wk'}
+        status, winner, _ = ChessRules.check_game_status(board, 'black')
+        self.assertEqual((status, winner), ('stalemate', None))
+
+    def test_insufficient_material(self):
+        board = {'e1': 'wk', 'e8': 'bk', 'c1': 'wb'}
+        status, _, _ = ChessRules.check_game_status(board, 'white')
+        self.assertEqual(status, 'draw')
+
+
+class TakeSeatTests(TestCase):
+
+    def setUp(self):
+        self.host = User.objects.create_user('host')
+        self.room = GameRoom.objects.create(name='room', host=self.host, max_players=2)
+        self.room.players.add(self.host)
+
+    def test_takes_free_seat(self):
+        user = User.objects.create_user('player')
+        self.assertTrue(take_seat(user, code=self.room.code))
+        self.assertEqual(self.room.players.count(), 2)
+
+    def test_refuses_full_room(self):
+        take_seat(User.objects.create_user('first'), code=self.room.code)
+        self.assertFalse(take_seat(User.objects.create_user('second'), code=self.room.code))
+        self.assertEqual(self.room.players.count(), 2)
+
+    def test_unknown_room(self):
+        with self.assertRaises(Http404):
+            take_seat(self.host, code='NOSUCHRM')
+
+
+class ConcurrentTakeSeatTests(TransactionTestCase):
+
+    def test_last_seat_goes_to_one_player(self):
+        host = User.objects.create_user('host')
+        room = GameRoom.objects.create(name='room', host=host, max_players=2)
+        room.players.add(host)
+        users = [User.objects.create_user(f'player{i}') for i in range(6)]
+        start = threading.Barrier(len(users))
+        results = []
+
+        def join(user):
+            start.wait()
+            try:
+                results.append(take_seat(user, code=room.code))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=join, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(results), [False] * 5 + [True])
+        self.assertEqual(room.players.count(), 2)
+
+class ClaimSeatTests(TestCase):
+
+    def setUp(self):
+        self.host = User.objects.create_user('host')
+        self.user = User.objects.create_user('player')
+
+    def make_room(self, age, max_players=4, host=None):
+        room = GameRoom.objects.create(name='room', host=host or self.host, max_players=max_players)
+        room.players.add(room.host)
+        GameRoom.objects.filter(pk=room.pk).update(created_at=timezone.now() - timedelta(minutes=age))
+        return room
+
+    def test_fills_oldest_open_room_first(self):
+        self.make_room(age=1)
+        oldest = self.make_room(age=5)
+        self.make_room(age=3)
+        self.assertEqual(claim_seat(self.user), oldest)
+        self.assertTrue(oldest.players.filter(pk=self.user.pk).exists())
+
+    def test_skips_full_own_and_started_rooms(self):
+        self.make_room(age=4, max_players=1)
+        self.make_room(age=3, host=self.user)
+        started = self.make_room(age=2)
+        GameRoom.objects.filter(pk=started.pk).update(status='playing')
+        self.assertIsNone(claim_seat(self.user))
+
+        open_room = self.make_room(age=1)
+        self.assertEqual(claim_seat(self.user), open_room)
+
+
+class GiveUpSeatTests(TestCase):
+
+    def setUp(self):
+        self.host = User.objects.create_user('host')
+        self.user = User.objects.create_user('player')
+        self.room = GameRoom.objects.create(name='room', host=self.host)
+        self.room.players.add(self.host, self.user)
+
+    def test_host_leaving_hands_the_room_on(self):
+        give_up_seat(self.host, self.room.code)
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.host, self.user)
+        self.assertEqual(list(self.room.players.all()), [self.user])
+
+    def test_last_player_leaving_deletes_the_room(self):
+        give_up_seat(self.user, self.room.code)
+        give_up_seat(self.host, self.room.code)
+        self.assertFalse(GameRoom.objects.filter(pk=self.room.pk).exists())
+
+
+class LobbyRoomsCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('player')
+        self.room = GameRoom.objects.create(name='room', host=self.user)
+        self.client.force_login(self.user)
+
+    def assertDroppedOnCommit(self):
+        # Still cached until the change commits, then gone
+        self.client.get(reverse('lobby'))
+        self.assertIsNotNone(cache.get(LOBBY_ROOMS_KEY))
+        return self.captureOnCommitCallbacks(execute=True)
+
+    def test_lobby_reuses_cached_rooms(self):
+        self.client.get(reverse('lobby'))
+        cached = cache.get(LOBBY_ROOMS_KEY)
+        self.assertEqual([room.code for room in cached], [self.room.code])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('lobby'), HTTP_IF_NONE_MATCH='"stale"')
+        self.assertFalse([q for q in queries if 'games_gameroom' in q['sql']])
+
+    def test_room_saved(self):
+        with self.assertDroppedOnCommit():
+            GameRoom.objects.create(name='other', host=self.user)
+            self.assertIsNotNone(cache.get(LOBBY_ROOMS_KEY))
+        self.assertIsNone(cache.get(LOBBY_ROOMS_KEY))
+
+    def test_players_changed(self):
+        with self.assertDroppedOnCommit():
+            self.room.players.add(self.user)
+        self.assertIsNone(cache.get(LOBBY_ROOMS_KEY))
+
+    def test_players_changed_from_user_side(self):
+        with self.assertDroppedOnCommit():
+            self.user.game_rooms.add(self.room)
+        self.assertIsNone(cache.get(LOBBY_ROOMS_KEY))
+
+    def test_room_deleted(self):
+        with self.assertDroppedOnCommit():
+            self.room.delete()
+        self.assertIsNone(cache.get(LOBBY_ROOMS_KEY))
+
+class RoomPlayersCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('player')
+        self.room = GameRoom.objects.create(name='room', host=self.user)
+        self.key = room_players_key(self.room.code)
+        cache.set(self.key, ['someone'])
+
+    def assertDropped(self, change):
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+            self.assertEqual(cache.get(self.key), ['someone'])
+        self.assertIsNone(cache.get(self.key))
+
+    def test_players_added(self):
+        self.assertDropped(lambda: self.room.players.add(self.user))
+
+    def test_players_removed(self):
+        self.room.players.add(self.user)
+        cache.set(self.key, ['someone'])
+        self.assertDropped(lambda: self.room.players.remove(self.user))
+
+    def test_rooms_changed_from_user_side(self):
+        self.assertDropped(lambda: self.user.game_rooms.add(self.room))
+
+    def test_room_deleted(self):
+        self.assertDropped(self.room.delete)
+
+class LobbyConditionalGetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('player')
+        self.client.force_login(self.user)
+
+    def poll(self, name='lobby'):
+        response = self.client.get(reverse(name))
+        self.assertEqual(response.status_code, 200)
+        return response, self.client.get(reverse(name), HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_lobby_is_not_modified(self):
+        _, again = self.poll()
+        self.assertEqual(again.status_code, 304)
+
+    def test_room_change_refreshes_lobby(self):
+        first, _ = self.poll()
+        with self.captureOnCommitCallbacks(execute=True):
+            GameRoom.objects.create(name='new room', host=self.user)
+        response = self.client.get(reverse('lobby'), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertContains(response, 'new room')
+
+    def test_stats_change_refreshes_lobby(self):
+        first, _ = self.poll()
+        with self.captureOnCommitCallbacks(execute=True):
+            stats = self.user.stats
+            stats.score = 1234
+            stats.save()
+        response = self.client.get(reverse('lobby'), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertContains(response, '1234')
+
+    def test_pending_message_is_shown_not_swallowed(self):
+        first, _ = self.poll()
+        self.client.post(reverse('register'), {
+            'username': 'newcomer', 'password1': 'a-long-pass-phrase', 'password2': 'a-long-pass-phrase',
+        })
+        response = self.client.get(reverse('lobby'), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertContains(response, 'Account created!')
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_chess_lobby_refreshes_on_game_change(self):
+        first, again = self.poll('chess_lobby')
+        self.assertEqual(again.status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            ChessGame.objects.create(white_player=self.user, is_bot_game=True, bot_color='black', status='playing')
+        response = self.client.get(reverse('chess_lobby'), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+
+async def connect(path, user):
+    communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path)
+    communicator.scope['user'] = user
+    connected, _ = await communicator.connect()
+    assert connected
+    return communicator
+
+
+async def wait_for(check, timeout=2):
+    # Background writes land a little after the frames that caused them
+    for _ in range(int(timeout / 0.02)):
+        if await check():
+            return True
+        await asyncio.sleep(0.02)
+    return False
+
+
+class ChatTests(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('player')
+        self.room = GameRoom.objects.create(name='room', host=self.user)
+        self.room.players.add(self.user)
+
+    async def test_burst_is_one_broadcast_and_one_row(self):
+        communicator = await connect(f'/ws/room/{self.room.code}/', self.user)
+        self.assertEqual((await communicator.receive_json_from())['type'], 'player_update')
+
+        for text in ('one', 'two', 'three'):
+            await communicator.send_json_to({'type': 'chat', 'message': text})
+        message = await communicator.receive_json_from()
+        self.assertEqual(message, {'type': 'chat', 'message': 'one\ntwo\nthree', 'username': 'player'})
+        self.assertTrue(await communicator.receive_nothing(0.1))
+
+        rows = ChatMessage.objects.filter(room=self.room)
+        self.assertTrue(await wait_for(rows.aexists))
+        self.assertEqual([row.content async for row in rows], ['one\ntwo\nthree'])
+        await communicator.disconnect()
+
+    async def test_rooms_chat_is_written_in_one_insert(self):
+        other = await User.objects.acreate(username='other')
+        first = await connect(f'/ws/room/{self.room.code}/', self.user)
+        second = await connect(f'/ws/room/{self.room.code}/', other)
+        await first.send_json_to({'type': 'chat', 'message': 'hello'})
+        await second.send_json_to({'type': 'chat', 'message': 'hi'})
+
+        rows = ChatMessage.objects.filter(room=self.room)
+        manager = ChatMessage.objects
+        with mock.patch.object(manager, 'abulk_create', wraps=manager.abulk_create) as bulk_create:
+            self.assertTrue(await wait_for(rows.aexists))
+        bulk_create.assert_called_once()
+        self.assertEqual(
+            sorted([(row.user_id, row.content) async for row in rows]),
+            [(self.user.pk, 'hello'), (other.pk, 'hi')],
+        )
+        await first.disconnect()
+        await second.disconnect()
+
+    async def test_full_batch_is_written_without_waiting(self):
+        consumer = consumers.GameConsumer()
+        consumer.room_code = self.room.code
+        consumer.user = self.user
+        rows = ChatMessage.objects.filter(room=self.room)
+        with mock.patch.object(consumers, 'CHAT_WRITE_DELAY', 60):
+            for i in range(consumers.CHAT_WRITE_BATCH + 1):
+                consumer.save_message(f'message {i}')
+            async def batch_written():
+                return await rows.acount() == consumers.CHAT_WRITE_BATCH
+            self.assertTrue(await wait_for(batch_written))
+            # The row after the full batch waits for its own timer
+            self.assertEqual(len(consumers.GameConsumer.pending_chat_rows[self.room.code]), 1)
+        for task in list(consumers.background_tasks):
+            task.cancel()
+        consumers.GameConsumer.pending_chat_rows.clear()
+
+
+class ChessFrameTests(TransactionTestCase):
+
+    def setUp(self):
+        self.white = User.objects.create_user('white')
+        self.black = User.objects.create_user('black')
+
+    async def play(self, board_state, move):
+        game = await ChessGame.objects.acreate(
+            white_player=self.white, black_player=self.black, status='playing', board_state=board_state
+        )
+        communicator = await connect(f'/ws/chess/game/{game.code}/', self.white)
+        self.assertEqual((await communicator.receive_json_from())['type'], 'game_state')
+        await communicator.send_json_to({'type': 'move', 'from': move[0], 'to': move[1]})
+        frame = json.loads(await communicator.receive_from())
+        self.assertTrue(await communicator.receive_nothing(0.05))
+        await communicator.disconnect()
+        return frame
+
+    async def test_single_message_is_an_object(self):
+        frame = await self.play(initial_board(), ('e2', 'e4'))
+        self.assertEqual(frame['type'], 'game_update')
+        self.assertEqual(frame['move'], {'from': 'e2', 'to': 'e4', 'piece': 'wp', 'captured': None})
+
+    async def test_messages_published_together_are_one_array(self):
+        frame = await self.play({'e1': 'wk', 'e8': 'bk', 'a1': 'wr'}, ('a1', 'a8'))
+        self.assertEqual([message['type'] for message in frame], ['game_update', 'check'])
+        self.assertEqual(frame[1]['color'], 'black')
+
+
+class BrokenPool:
+    """Stands in for a process pool one of whose workers died"""
+
+    def __init__(self, *args, **kwargs):
+        self.shut_down = False
+
+    def submit(self, *args):
+        raise BrokenProcessPool('A worker process died')
+
+    def shutdown(self, wait=True):
+        self.shut_down = True
+
+
+def thread_pool(max_workers, mp_context):
+    return ThreadPoolExecutor(max_workers)
+
+
+class BotPoolTests(SimpleTestCase):
+
+    def setUp(self):
+        self.addCleanup(setattr, consumers, 'bot_pool', consumers.bot_pool)
+
+    async def test_broken_pool_is_replaced_and_search_retried(self):
+        broken = consumers.bot_pool = BrokenPool()
+        with mock.patch.object(consumers, 'ProcessPoolExecutor', thread_pool):
+            move = await consumers.search_bot_move(initial_board(), 'white')
+        self.assertTrue(broken.shut_down)
+        self.assertIsInstance(consumers.bot_pool, ThreadPoolExecutor)
+        consumers.bot_pool.shutdown()
+        position = Position.from_dict(initial_board())
+        self.assertIn(move, [(SQ_NAMES[f], SQ_NAMES[t]) for f, t in generate_legal_moves(position, 0)])
+
+    async def test_search_gives_up_when_the_new_pool_breaks_too(self):
+        consumers.bot_pool = BrokenPool()
+        with mock.patch.object(consumers, 'ProcessPoolExecutor', BrokenPool):
+            with self.assertRaises(BrokenProcessPool):
+                await consumers.search_bot_move(initial_board(), 'white')
+
+
+class MigrationTestCase(TransactionTestCase):
+    """Runs the games app's migrations from migrate_from up to migrate_to"""
+
+    migrate_from = migrate_to = None
+
+    def setUp(self):
+        self.apps = self.migrate_games(self.migrate_from)
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def migrate_games(self, name):
+        executor = MigrationExecutor(connection)
+        executor.migrate([('games', name)])
+        executor.loader.build_graph()
+        return executor.loader.project_state([('games', name)]).apps
+
+
+class MoveHistoryMigrationTests(MigrationTestCase):
+    migrate_from = '0004_chessgame_status_index'
+    migrate_to = '0005_chessgame_board_default'
+
+    def test_move_history_becomes_chess_moves(self):
+        User = self.apps.get_model('auth', 'User')
+        ChessGame = self.apps.get_model('games', 'ChessGame')
+        ChessMove = self.apps.get_model('games', 'ChessMove')
+        user = User.objects.create(username='player')
+        game = ChessGame.objects.create(code='OLDGAME1', white_player=user, move_history=[
+            {'from': 'e2', 'to': 'e4', 'piece': 'wp', 'captured': None},
+            {'from': 'e7', 'to': 'e5', 'piece': 'bp', 'captured': None, 'bot': True},
+            {'from': 'b7', 'to': 'b8', 'piece': 'wn', 'captured': None, 'promotion': 'n'},
+            {'from': 'a2', 'to': 'a3', 'piece': 'wp', 'captured': None, 'promotion': 'q'},
+        ])
+        # Games that already have ChessMove rows are left alone
+        moved = ChessGame.objects.create(code='NEWGAME1', white_player=user, move_history=[
+            {'from': 'd2', 'to': 'd4', 'piece': 'wp', 'captured': None},
+        ])
+        ChessMove.objects.create(game=moved, from_pos='d2', to_pos='d4', piece='wp')
+
+        apps = self.migrate_games(self.migrate_to)
+        ChessMove = apps.get_model('games', 'ChessMove')
+        self.assertEqual(
+            list(ChessMove.objects.filter(game_id=game.pk).order_by('id').values_list(
+                'from_pos', 'to_pos', 'piece', 'promotion', 'is_bot'
+            )),
+            [
+                ('e2', 'e4', 'wp', None, False),
+                ('e7', 'e5', 'bp', None, True),
+                ('b7', 'b8', 'wn', 'n', False),
+                ('a2', 'a3', 'wp', None, False),
+            ],
+        )
+        self.assertEqual(ChessMove.objects.filter(game_id=moved.pk).count(), 1)
+
+
+class PlayerStatsBackfillTests(MigrationTestCase):
+    migrate_from = '0005_chessgame_board_default'
+    migrate_to = '0006_playerstats_backfill'
+
+    def test_users_without_stats_get_them(self):
+        User = self.apps.get_model('auth', 'User')
+        PlayerStats = self.apps.get_model('games', 'PlayerStats')
+        old = User.objects.create(username='old')
+        User.objects.create(username='older')
+        PlayerStats.objects.create(user=old, games_played=3)
+
+        apps = self.migrate_games(self.migrate_to)
+        PlayerStats = apps.get_model('games', 'PlayerStats')
+        self.assertEqual(
+            sorted(PlayerStats.objects.values_list('user__username', 'games_played')),
+            [('old', 3), ('older', 0)],
+        )
+
+
+class PlayerStatsSignalTests(TestCase):
+
+    def test_new_user_gets_stats(self):
+        user = User.objects.create_user('player')
+        self.assertEqual(user.stats.games_played, 0)
+
+    def test_raw_save_brings_its_own_stats(self):
+        user = User(username='fixture')
+        user.save_base(raw=True)
+        self.assertFalse(PlayerStats.objects.filter(user=user).exists())
@@ -3,7 +3,17 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import logout
 from django.contrib import messages
-from .models import GameRoom, PlayerStats, ChessGame
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.views.decorators.http import condition
+from asgiref.sync import sync_to_async
+from .models import GameRoom, ChessGame
+from .signals import (
+    CHESS_LOBBY_CHANGED_KEY, LOBBY_CHANGED_KEY, LOBBY_ROOMS_KEY, LOBBY_ROOMS_TIMEOUT, changed_at,
+    stats_changed_key,
+)
 
 def home(request):
     return render(request, 'games/home.html')
@@ -12,8 +22,7 @@ def register(request):
     if request.method == 'POST':
         form = UserCreationForm(request.POST)
         if form.is_valid():
-            user = form.save()
-            PlayerStats.objects.create(user=user)
+            form.save()
             messages.success(request, 'Account created! Please log in.')
             return redirect('login')
     else:
@@ -22,22 +31,77 @@ def register(request):
 
 @login_required
 def game_selection(request):
-    if not hasattr(request.user, 'stats'):
-        PlayerStats.objects.create(user=request.user)
     return render(request, 'games/game_selection.html')
 
+def has_pending_messages(request):
+    # A 304 would swallow flash messages base.html has yet to show, so
+    # pages with messages waiting get no ETag
+    return len(messages.get_messages(request)) > 0
+
+def lobby_etag(request):
+    # The page shows the user's own name and stats, so the tag is per user
+    # and changes with their stats
+    if has_pending_messages(request):
+        return None
+    user_id = request.user.pk
+    return f'{user_id}-{changed_at(stats_changed_key(user_id))}-{changed_at(LOBBY_CHANGED_KEY)}'
+
+def chess_lobby_etag(request):
+    if has_pending_messages(request):
+        return None
+    return f'{request.user.pk}-{changed_at(CHESS_LOBBY_CHANGED_KEY)}'
+
 @login_required
+@condition(etag_func=lobby_etag)
 def lobby(request):
-    rooms = GameRoom.objects.filter(status='waiting').order_by('-created_at')
-    if not hasattr(request.user, 'stats'):
-        PlayerStats.objects.create(user=request.user)
+    # Shared by every lobby visitor until a room changes (see signals)
+    rooms = cache.get(LOBBY_ROOMS_KEY)
+    if rooms is None:
+        rooms = list(
+            GameRoom.objects.filter(status='waiting').select_related('host')
+            .only('code', 'name', 'max_players', 'status', 'host__username')
+            .annotate(player_count=Count('players')).order_by('-created_at')
+        )
+        cache.set(LOBBY_ROOMS_KEY, rooms, LOBBY_ROOMS_TIMEOUT)
     return render(request, 'games/lobby.html', {'rooms': rooms})
 
+def take_seat(user, **room_lookup):
+    # The room row stays locked from the count to the insert, so two joins
+    # can't both take a room's last seat (on SQLite, which has no row locks,
+    # the IMMEDIATE transaction mode locks the database instead); returns
+    # whether user got one
+    with transaction.atomic():
+        room = get_object_or_404(GameRoom.objects.select_for_update().only('code', 'max_players'), **room_lookup)
+        if room.players.count() >= room.max_players:
+            return False
+        room.players.add(user)
+    return True
+
+def claim_seat(user):
+    # Finds and locks the first waiting room with a free seat in one query;
+    # the players are counted in a subquery since FOR UPDATE can't be used
+    # with GROUP BY, and rooms other matchmakers hold locked are skipped.
+    # The oldest open room is filled first
+    seats_taken = (
+        GameRoom.players.through.objects.filter(gameroom=OuterRef('pk'))
+        .values('gameroom').annotate(total=Count('*')).values('total')
+    )
+    with transaction.atomic():
+        room = (
+            GameRoom.objects.select_for_update(skip_locked=True)
+            .filter(status='waiting').exclude(host=user)
+            .annotate(player_total=Coalesce(Subquery(seats_taken), 0))
+            .filter(player_total__lt=F('max_players'))
+            .order_by('created_at').only('code').first()
+        )
+        if room:
+            room.players.add(user)
+    return room
+
 @login_required
 def matchmaking(request):
-    room = GameRoom.objects.filter(status='waiting').exclude(host=request.user).first()
-    if room and room.players.count() < room.max_players:
-        room.players.add(request.user)
+    room = claim_seat(request.user)
+    if room:
         return redirect('game_room', code=room.code)
     return render(request, 'games/matchmaking.html')
 
@@ -46,34 +110,48 @@ def create_room(request):
     if request.method == 'POST':
         name = request.POST.get('name', f"{request.user.username}'s Room")
         max_players = int(request.POST.get('max_players', 4))
-        room = GameRoom.objects.create(host=request.user, name=name, max_players=max_players)
-        room.players.add(request.user)
+        with transaction.atomic():
+            room = GameRoom.objects.create(host=request.user, name=name, max_players=max_players)
+            # A new room has no members and no cached player list yet, so
+            # insert the membership row directly instead of players.add()
+            GameRoom.players.through.objects.create(gameroom=room, user=request.user)
         return redirect('game_room', code=room.code)
     return render(request, 'games/create_room.html')
 
+# Views that only change rows and redirect are async and hold the sync
+# thread only for their database work; pages that render templates stay
+# sync, as their templates load related objects lazily
+
 @login_required
-def join_room(request, code):
-    room = get_object_or_404(GameRoom, code=code)
-    if room.players.count() < room.max_players:
-        room.players.add(request.user)
+async def join_room(request, code):
+    # Count and insert in one thread hop, under the room's row lock
+    await sync_to_async(take_seat)(await request.auser(), code=code)
     return redirect('game_room', code=code)
 
 @login_required
 def game_room(request, code):
-    room = get_object_or_404(GameRoom, code=code)
+    # The page only needs the room's own columns; the host is compared by id
+    room = get_object_or_404(GameRoom.objects.only('code', 'name', 'status', 'max_players', 'host'), code=code)
     return render(request, 'games/game_room.html', {'room': room})
 
+def give_up_seat(user, code):
+    # Locked like take_seat, so concurrent leaves can't both pick (or both
+    # miss) a new host
+    with transaction.atomic():
+        room = get_object_or_404(GameRoom.objects.select_for_update().only('code', 'host'), code=code)
+        room.players.remove(user)
+        if room.host_id == user.id:
+            # Only the next host's id is needed, not their user row
+            new_host_id = room.players.values_list('id', flat=True).first()
+            if new_host_id:
+                room.host_id = new_host_id
+                room.save(update_fields=['host'])
+            else:
+                room.delete()
+
 @login_required
-def leave_room(request, code):
-    room = get_object_or_404(GameRoom, code=code)
-    room.players.remove(request.user)
-    if room.host == request.user:
-        if room.players.exists():
-            room.host = room.players.first()
-            room.save()
-        else:
-            room.delete()
-            return redirect('lobby')
+async def leave_room(request, code):
+    await sync_to_async(give_up_seat)(await request.auser(), code)
     return redirect('lobby')
 
 
@@ -83,8 +161,16 @@ def custom_logout(request):
 
 
 @login_required
+@condition(etag_func=chess_lobby_etag)
 def chess_lobby(request):
-    active_games = ChessGame.objects.filter(status='playing').order_by('-created_at')[:10]
+    # Plain dicts: the list is display-only, so no model instances are built
+    active_games = (
+        ChessGame.objects.filter(status='playing').order_by('-created_at')
+        .values(
+            'is_bot_game', 'current_turn',
+            white=F('white_player__username'), black=F('black_player__username'),
+        )[:10]
+    )
     return render(request, 'games/chess_lobby.html', {'active_games': active_games})
 
 @login_required
@@ -92,11 +178,10 @@ def chess_matchmaking(request):
     return render(request, 'games/chess_matchmaking.html')
 
 @login_required
-def chess_vs_bot(request):
+async def chess_vs_bot(request):
     # Create immediate bot game
-    import random
-    game = ChessGame.objects.create(
-        white_player=request.user,
+    game = await ChessGame.objects.acreate(
+        white_player=await request.auser(),
         is_bot_game=True,
         bot_color='black',
         status='playing'
@@ -105,16 +190,16 @@ def chess_vs_bot(request):
 
 @login_required
 def chess_game(request, code):
-    from .models import ChessGame
-    game = get_object_or_404(ChessGame, code=code)
+    # The template shows both usernames, so fetch both players with the game
+    game = get_object_or_404(ChessGame.objects.select_related('white_player', 'black_player'), code=code)
     
     # Determine player color
     player_color = None
     opponent = None
-    if game.white_player == request.user:
+    if game.white_player_id == request.user.id:
         player_color = 'white'
         opponent = game.black_player.username if game.black_player else 'Bot'
-    elif game.black_player == request.user:
+    elif game.black_player_id == request.user.id:
         player_color = 'black'
         opponent = game.white_player.username if game.white_player else 'Bot'
     
@@ -59,9 +59,20 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # SQLite ignores select_for_update(); taking the write lock when a
+        # transaction starts makes concurrent seat changes wait their turn
+        # instead of failing with "database is locked" on upgrade
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+        # A file, not the default in-memory database, so tests see the same
+        # locking between connections as the server does
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+# Sessions are read from the cache and written through to the database,
+# so a signed-in request doesn't query the session table
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},